@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
 
 import numpy as np
@@ -5,7 +6,7 @@ from munch import Munch, unmunchify
 from viktor import ViktorController
 from viktor.api_v1 import FileResource
 from viktor.core import File, Storage, UserMessage
-from viktor.errors import UserError
+from viktor.errors import InputViolation, UserError
 from viktor.external.spreadsheet import (
     SpreadsheetCalculation,
     SpreadsheetCalculationInput,
@@ -17,24 +18,64 @@ from viktor.utils import convert_word_to_pdf
 from viktor.views import DataGroup, DataItem, DataResult, DataView, PDFResult, PDFView
 
 from app.auto_invoice.definitions import (
+    FINANCE_DATA_KEY,
     checkInvoiceSetup,
-    convertDateToOrdinal,
+    checkStatementSetup,
     convertExcelFloat,
     convertExcelOrdinal,
     convertOrdinalToDate,
+    generateExportName,
     generateInvoiceName,
-    getFinanceDataAttributeFromStorage,
+    generateStatementName,
+    getFinanceDataDelta,
     getFinanceDataFromStorage,
+    getFinanceDataRevision,
+    getFinanceDataYears,
+    getFinanceSegmentYears,
     getInvoiceNumberFromPeriodAndIndex,
     getInvoicePeriodFromNumber,
     getInvoicePeriods,
     getPeriodOrdinals,
+    getUploadFingerprint,
+    loadFinanceData,
+    loadSearchIndex,
     removeSpecialCharacters,
-    saveFinanceDataToStorage,
+    saveUploadFingerprint,
+    updateFinanceDataInStorage,
 )
+from app.auto_invoice.export import (
+    iterExportChunks,
+    writeFinanceCsv,
+    writeFinanceXlsx,
+)
+from app.auto_invoice.finance_data import formatFinanceFloat
+from app.auto_invoice.ingest import (
+    hashFiles,
+    hashWorkbookValues,
+    mergeFinanceData,
+    timed,
+)
+from app.auto_invoice.invoice_lines import (
+    LINE_MODE_ALL,
+    iterInvoiceLines,
+    summarizeInvoiceLines,
+)
+from app.auto_invoice.invoice_number import InvoiceNumber, sortInvoiceNumbers
 from app.auto_invoice.parametrization import Parametrization
+from app.auto_invoice.pdf_preview import PREVIEW_MODE_FAST, renderInvoicePreviewPdf
+from app.auto_invoice.prerender import InvoicePrerenderer, invoiceFingerprint
+from app.auto_invoice.reconciliation import (
+    RECONCILIATION_KINDS,
+    ReconciliationReport,
+    reconcileFinanceData,
+)
+from app.auto_invoice.statement import summarizeStatementLines
 from app.helper import pyutils
 
+PRERENDERER = InvoicePrerenderer()
+
+RECONCILIATION_MAX_ITEMS = 100  # per group in the reconciliation view
+
 
 class Controller(ViktorController):
     label = "autoInvoice"
@@ -42,36 +83,100 @@ class Controller(ViktorController):
 
     def updateFinanceData(self, params, **kwargs) -> None:
         """
-        Update finance data in storage
+        Update finance data in storage. Uploads identical to the previous one, or
+        with identical cell contents (e.g. only formatting changed), are skipped
+        before evaluation.
+        """
+        financeFile = Controller.obtainFileFromResource(params.uploadStep.financeSheet)
+        fingerprint = getUploadFingerprint()
+        if (fileHash := hashFiles([financeFile])) == fingerprint.get("file"):
+            UserMessage.info("No changes detected in finance data (identical file)")
+            return
+
+        if (sheetHash := hashWorkbookValues([financeFile])) == fingerprint.get("sheet"):
+            saveUploadFingerprint(fileHash, sheetHash)
+            UserMessage.info("No changes detected in finance data (identical data)")
+            return
+
+        values = Controller.evaluateFinanceSheet(financeFile)
+        financeData, warnings = Controller.parseFinanceValues(values)
+        Controller.reportWarnings(warnings)
+        self.storeFinanceData(financeData, kwargs.get("entity_id"))
+        saveUploadFingerprint(fileHash, sheetHash)
+
+    def updateFinanceDataFromWorkbooks(self, params, **kwargs) -> None:
+        """
+        Update finance data in storage from several workbooks (e.g. one per coach).
+        Workbooks are evaluated and parsed concurrently and merged per client and
+        date. Parsing takes milliseconds next to the evaluation, so it runs on the
+        same threads: starting worker processes would cost more than it saves.
+        """
+        if not (fileResources := params.uploadStep.get("financeSheets")):
+            raise UserError("No finance (*.xlsx) files found.")
+        names = [fileResource.filename for fileResource in fileResources]
+        files = [Controller.obtainFileFromResource(f) for f in fileResources]
+        fingerprint = getUploadFingerprint()
+        if (fileHash := hashFiles(files)) == fingerprint.get("file"):
+            UserMessage.info("No changes detected in finance data (identical files)")
+            return
+        if (sheetHash := hashWorkbookValues(files)) == fingerprint.get("sheet"):
+            saveUploadFingerprint(fileHash, sheetHash)
+            UserMessage.info("No changes detected in finance data (identical data)")
+            return
+
+        def ingestAll() -> list[tuple]:
+            with ThreadPoolExecutor(max_workers=len(files)) as executor:
+                return list(executor.map(Controller.ingestWorkbook, files))
+
+        ingested, wallTime = timed(ingestAll)
+        for name, (_, evaluateTime, parseTime) in zip(names, ingested):
+            UserMessage.info(
+                f"{name}: evaluated in {evaluateTime:.2f} s, parsed in {parseTime:.2f} s"
+            )
+        UserMessage.info(f"{len(files)} workbooks ingested in {wallTime:.2f} s")
+        for (_, warnings), _, _ in ingested:
+            Controller.reportWarnings(warnings)
+        financeData, report = mergeFinanceData(
+            [data for (data, _), _, _ in ingested], names
+        )
+        if report.duplicates:
+            UserMessage.info(f"{report.duplicates} duplicate rows found across files")
+        for client, date, conflictNames in report.conflicts:
+            UserMessage.warning(
+                f"Conflicting rows for {client} on {date} in {', '.join(conflictNames)}, "
+                f"using {conflictNames[-1]}"
+            )
+        self.storeFinanceData(financeData, kwargs.get("entity_id"))
+        saveUploadFingerprint(fileHash, sheetHash)
+
+    def storeFinanceData(self, financeData: dict, entityId: int) -> None:
+        """
+        Apply changes in (newly uploaded) finance data to storage. The stored
+        result (old data with the changes applied) of the uploaded years is
+        reconciled afterwards.
         """
+        years = getFinanceDataYears(financeData)
         oldFinanceData = {}
-        financeData = self.getFinanceDataExcel(params)
         storage = Storage()
-        if "financeData" in storage.list(scope="entity"):
-            oldFinanceData = getFinanceDataFromStorage()
+        if FINANCE_DATA_KEY in storage.list(scope="entity"):
+            oldFinanceData = getFinanceDataFromStorage(years=years)
 
         # compare old and new data
-        if financeData == oldFinanceData:
+        if not (delta := getFinanceDataDelta(oldFinanceData, financeData)):
             UserMessage.info("No changes detected in finance data")
-            return
         else:
             UserMessage.info("New clients data detected")
 
-        # update finance data
-        UserMessage.info("Updating finance data")
-        newFinanceData = dict(oldFinanceData)
-        for client in financeData["availableClients"]:
-            if client not in newFinanceData:
-                newFinanceData[client] = financeData[client]
-            else:
-                newFinanceData[client].update(financeData[client])
-
-        newFinanceData["availableClients"] = financeData["availableClients"]
-        newFinanceData["clientNumbers"] = financeData["clientNumbers"]
+            # update finance data, only the changed rows are (re)applied on conflicts
+            UserMessage.info("Updating finance data")
+            updateFinanceDataInStorage(entityId, delta)
 
-        # save new finance data
-        saveFinanceDataToStorage(newFinanceData)
-        UserMessage.success("Finance data updated")
+            # build search index for client and invoice number selection
+            loadSearchIndex(entityId)
+            UserMessage.success("Finance data updated")
+        Controller.reportReconciliation(
+            reconcileFinanceData(loadFinanceData(entityId, years=years))
+        )
 
     @DataView("Finance data", duration_guess=5)
     def viewFinanceData(self, params, **kwargs) -> SpreadsheetResult:
@@ -81,6 +186,42 @@ class Controller(ViktorController):
         financeData = getFinanceDataFromStorage()
         return DataResult(Controller.unpackDataIntoDataItems(financeData))
 
+    def downloadFinanceDataCsv(self, params, **kwargs):
+        """
+        Export (filtered) finance data to csv, written chunk by chunk
+        """
+        exportFile = File()
+        with exportFile.open(encoding="utf-8") as stream:
+            count = writeFinanceCsv(
+                self.getExportChunks(params, kwargs.get("entity_id")), stream
+            )
+        UserMessage.info(f"{count} payments exported")
+        return DownloadResult(exportFile, generateExportName(params, fn_ext="csv"))
+
+    def downloadFinanceDataXlsx(self, params, **kwargs):
+        """
+        Export (filtered) finance data to xlsx, written chunk by chunk
+        """
+        exportFile = File()
+        with exportFile.open_binary() as stream:
+            count = writeFinanceXlsx(
+                self.getExportChunks(params, kwargs.get("entity_id")), stream
+            )
+        UserMessage.info(f"{count} payments exported")
+        return DownloadResult(exportFile, generateExportName(params, fn_ext="xlsx"))
+
+    @DataView("Reconciliation", duration_guess=5)
+    def viewReconciliation(self, params, **kwargs) -> DataResult:
+        """
+        View exceptions of reconciling all payments (including archived years) with
+        the invoice numbers and their periods
+        """
+        financeData = loadFinanceData(
+            kwargs.get("entity_id"), years=getFinanceSegmentYears()
+        )
+        report = reconcileFinanceData(financeData)
+        return DataResult(Controller.reconciliationDataGroup(report))
+
     def setupInvoice(self, params, **kwargs) -> SetParamsResult:
         """
         Search for invoice in finance data. The goal of this function
@@ -96,7 +237,7 @@ class Controller(ViktorController):
             year = params.invoiceStep.invoiceYear
             index = params.invoiceStep.invoiceIndex
             invoiceParams.invoiceNumber = getInvoiceNumberFromPeriodAndIndex(
-                clientName, index, period, year
+                kwargs.get("entity_id"), clientName, index, period, year
             )
         if invoiceParams.searchMethod == "Factuurnummer":
             index, period, year = getInvoicePeriodFromNumber(
@@ -106,16 +247,34 @@ class Controller(ViktorController):
             invoiceParams.invoicePeriod = period
             invoiceParams.invoiceYear = year
 
+        # start rendering the official document in the background, such that the
+        # official view, download and save pick it up (the fast view does not use it)
+        jobParams = Munch(invoiceStep=Munch(invoiceParams))
+        if checkInvoiceSetup(jobParams, **kwargs):
+            PRERENDERER.submit(
+                kwargs.get("entity_id"),
+                self.getInvoiceFingerprint(jobParams, kwargs.get("entity_id")),
+                self.renderInvoiceArtifacts,
+                jobParams,
+                kwargs.get("entity_id"),
+            )
+
         UserMessage.success("Factuur samengesteld!")
         return SetParamsResult({"invoiceStep": unmunchify(invoiceParams)})
 
     @PDFView("PDF viewer", duration_guess=5)
     def viewInvoice(self, params, **kwargs):
-        if checkInvoiceSetup(params):
-            wordFile = self.renderInvoiceWordFile(params)
-            with wordFile.open_binary() as f1:
-                pdf_file = convert_word_to_pdf(f1)
-            return PDFResult(file=pdf_file)
+        if checkInvoiceSetup(params, **kwargs):
+            previewMode = params.invoiceStep.get("previewMode") or PREVIEW_MODE_FAST
+            if previewMode == PREVIEW_MODE_FAST:
+                components = self.gatherInvoiceComponents(
+                    params, kwargs.get("entity_id")
+                )
+                return PDFResult(
+                    file=File.from_data(renderInvoicePreviewPdf(components))
+                )
+            artifacts = self.getInvoiceArtifacts(params, kwargs.get("entity_id"))
+            return PDFResult(file=File.from_data(artifacts.pdf))
         else:
             raise UserError("Stel eerst de factuur op voordat je deze kunt bekijken")
 
@@ -123,7 +282,7 @@ class Controller(ViktorController):
         """
         Load invoice from storage
         """
-        key = generateInvoiceName(params)
+        key = generateInvoiceName(params, fn_ext="docx")
         if key not in Storage().list(scope="entity"):
             raise UserError(f"No invoice {key} found in storage")
         return Storage().get(key, scope="entity")
@@ -132,21 +291,42 @@ class Controller(ViktorController):
         """
         Save rendered invoice to storage
         """
-        wordFile = self.renderInvoiceWordFile(params)
-        key = generateInvoiceName(params)
-        Storage().set(key, data=wordFile, scope="entity")
+        artifacts = self.getInvoiceArtifacts(params, kwargs.get("entity_id"))
+        key = generateInvoiceName(params, fn_ext="docx")
+        Storage().set(key, data=File.from_data(artifacts.word), scope="entity")
 
     def downloadInvoicePDF(self, params, **kwargs):
-        word_file = self.renderInvoiceWordFile(params)
+        artifacts = self.getInvoiceArtifacts(params, kwargs.get("entity_id"))
         fn = generateInvoiceName(params, fn_ext="pdf")
-        with word_file.open_binary() as f1:
-            pdf_file = convert_word_to_pdf(f1)
-        return DownloadResult(pdf_file, fn)
+        return DownloadResult(artifacts.pdf, fn)
 
     def downLoadInvoiceWord(self, params, **kwargs):
-        word_file = self.renderInvoiceWordFile(params)
+        artifacts = self.getInvoiceArtifacts(params, kwargs.get("entity_id"))
         fn = generateInvoiceName(params, fn_ext="docx")
-        return DownloadResult(word_file, fn)
+        return DownloadResult(artifacts.word, fn)
+
+    @PDFView("Klantoverzicht", duration_guess=2)
+    def viewStatement(self, params, **kwargs):
+        if not checkStatementSetup(params, **kwargs):
+            raise UserError("Kies eerst een klant en periode voor het overzicht")
+        components = self.gatherStatementComponents(params, kwargs.get("entity_id"))
+        return PDFResult(
+            file=File.from_data(
+                renderInvoicePreviewPdf(components, title="OVERZICHT (voorbeeld)")
+            )
+        )
+
+    def downloadStatementPDF(self, params, **kwargs):
+        wordFile = self.renderStatementWordFile(params, kwargs.get("entity_id"))
+        with wordFile.open_binary() as f1:
+            pdfFile = convert_word_to_pdf(f1)
+        fn = generateStatementName(params, fn_ext="pdf")
+        return DownloadResult(pdfFile.getvalue_binary(), fn)
+
+    def downloadStatementWord(self, params, **kwargs):
+        wordFile = self.renderStatementWordFile(params, kwargs.get("entity_id"))
+        fn = generateStatementName(params, fn_ext="docx")
+        return DownloadResult(wordFile.getvalue_binary(), fn)
 
     ####################################################
     ################# Helper functions #################
@@ -187,16 +367,117 @@ class Controller(ViktorController):
                 raise UserError(f"Unknown data type {type(value)} in finance data")
         return DataGroup(*dataItems)
 
-    def renderInvoiceWordFile(self, params, **kwargs) -> File:
+    @staticmethod
+    def reportReconciliation(report: ReconciliationReport) -> None:
+        """
+        Report reconciliation exceptions of uploaded finance data
+        """
+        if len(report):
+            UserMessage.warning(
+                f"Reconciliation: {report.summary()}, see the reconciliation view"
+            )
+        else:
+            UserMessage.info("Reconciliation: no exceptions found")
+
+    @staticmethod
+    def reconciliationDataGroup(report: ReconciliationReport) -> DataGroup:
+        """
+        Group reconciliation exceptions per kind and client, each group is capped at
+        RECONCILIATION_MAX_ITEMS items
+        """
+        kindItems = []
+        for kind in RECONCILIATION_KINDS:
+            clients = {}
+            for issue in report.byKind(kind):
+                clients.setdefault(issue.client, []).append(issue)
+            clientItems = []
+            for client, issues in list(clients.items())[:RECONCILIATION_MAX_ITEMS]:
+                issueItems = [
+                    DataItem(issue.date or issue.invoiceNumber, issue.invoiceNumber)
+                    for issue in issues[:RECONCILIATION_MAX_ITEMS]
+                ]
+                clientItems.append(
+                    DataItem(client, len(issues), subgroup=DataGroup(*issueItems))
+                )
+            if clientItems:
+                kindItems.append(
+                    DataItem(
+                        kind, report.counts[kind], subgroup=DataGroup(*clientItems)
+                    )
+                )
+            else:
+                kindItems.append(DataItem(kind, 0))
+        return DataGroup(*kindItems)
+
+    def getExportChunks(self, params, entityId: int):
+        """
+        Get payment chunks for the export, filtered on client and date range. Only
+        the archived years within the date range are loaded.
+        """
+        exportParams = params.exportStep
+        startDate = exportParams.get("startDate")
+        endDate = exportParams.get("endDate")
+        if startDate is not None and endDate is not None and startDate > endDate:
+            violation = InputViolation(
+                "Start date should be before end date",
+                fields=["exportStep.startDate", "exportStep.endDate"],
+            )
+            raise UserError("Invalid export period", input_violations=[violation])
+        years = getFinanceSegmentYears()
+        if startDate is not None:
+            years = [year for year in years if year >= startDate.year]
+        if endDate is not None:
+            years = [year for year in years if year <= endDate.year]
+
+        financeData = loadFinanceData(entityId, years=years)
+        clientName = exportParams.get("clientName")
+        if clientName is not None and financeData.client(clientName) is None:
+            raise UserError(f"Client {clientName} not found in finance data")
+        return iterExportChunks(
+            financeData,
+            clients=[clientName] if clientName else None,
+            start=None if startDate is None else startDate.toordinal(),
+            end=None if endDate is None else endDate.toordinal(),
+        )
+
+    def getInvoiceFingerprint(self, params, entityId: int) -> str:
+        """
+        Fingerprint of invoice parameters and the finance data they are rendered from
+        """
+        return invoiceFingerprint(
+            params.invoiceStep, entityId, getFinanceDataRevision()
+        )
+
+    def getInvoiceArtifacts(self, params, entityId: int) -> Munch:
+        """
+        Get rendered invoice (docx and pdf bytes), preferably from the background job
+        started by setupInvoice. Renders synchronously if there is no such job.
+        """
+        fingerprint = self.getInvoiceFingerprint(params, entityId)
+        if (artifacts := PRERENDERER.get(fingerprint)) is None:
+            artifacts = self.renderInvoiceArtifacts(params, entityId)
+        return artifacts
+
+    def renderInvoiceArtifacts(self, params, entityId: int) -> Munch:
+        """
+        Render invoice to docx and convert it to pdf
+        """
+        wordFile = self.renderInvoiceWordFile(params, entityId)
+        with wordFile.open_binary() as f1:
+            pdfFile = convert_word_to_pdf(f1)
+        return Munch(word=wordFile.getvalue_binary(), pdf=pdfFile.getvalue_binary())
+
+    def renderInvoiceWordFile(self, params, entityId: int) -> File:
         """
         Render invoice using template with most up to date input
         """
         template_dir = pyutils.get_root() / "app" / "lib" / "invoice_template.docx"
         with open(template_dir, "rb") as template:
-            result = render_word_file(template, self.gatherInvoiceComponents(params))
+            components = self.gatherInvoiceComponents(params, entityId)
+            result = render_word_file(template, components)
         return result
 
-    def gatherInvoiceComponents(self, params, **kwargs) -> list[WordFileTag]:
+    def gatherInvoiceComponents(self, params, entityId: int) -> list[WordFileTag]:
         """
         gather list of WordFileTag objects to be used in the render_word_file function
         Combine data from source excel file and user input. Idea is that user can choose which client
@@ -205,7 +486,8 @@ class Controller(ViktorController):
         invoiceData = params.invoiceStep
 
         # client details
-        clientData = Munch(getFinanceDataAttributeFromStorage(invoiceData.clientName))
+        financeData = loadFinanceData(entityId, years=[invoiceData.invoiceYear])
+        clientData = financeData.client(invoiceData.clientName)
         clientAddres = Munch(
             streetAndNumber=clientData.streetAndNumber,
             postalCode=clientData.postalCode,
@@ -220,51 +502,17 @@ class Controller(ViktorController):
         expirationDate = convertOrdinalToDate(invoiceDateOrdinal + 30)
 
         # payment data
-        currentPayments = []
-        clientData = getFinanceDataAttributeFromStorage(invoiceData.clientName)
         periods = getInvoicePeriods(params)
         periodNumber = periods.index(invoiceData.invoicePeriod)
         start, end = getPeriodOrdinals(periodNumber, invoiceData.invoiceYear)
-        totalExcl = 0
-        tax = 0
-        total = 0
-        for date, data in clientData.items():
-            if "/" in date:
-                currentPayment = {}
-                ordinal = convertDateToOrdinal(date)
-                if start <= ordinal <= end:
-                    # date
-                    currentPayment["date"] = date
-
-                    # quantity
-                    quantity = float(data["quantity"])
-                    currentPayment["quantity"] = f"{quantity:.1f}"
-
-                    # exclusive price
-                    priceExcl = float(data["priceExcl"]) / quantity
-                    currentPayment["price"] = f"{priceExcl:.2f}"
-
-                    subtotal = quantity * priceExcl
-                    currentPayment["total"] = f"{subtotal:.2f}"
-
-                    # inclusive price
-                    priceIncl = float(data["priceIncl"])
-
-                    # taxrate
-                    taxrate = (priceIncl - subtotal) / subtotal * 100
-                    currentPayment["taxRate"] = f"{taxrate:.0f}"
-
-                    # description
-                    description = data["description"]
-                    currentPayment["description"] = description
-
-                    # save current payment
-                    currentPayments.append(currentPayment)
-
-                    # cumalatives
-                    totalExcl += subtotal
-                    tax += priceIncl - subtotal
-                    total += priceIncl
+        payments = clientData.payments.between(start, end)
+        lineMode = invoiceData.get("lineMode") or LINE_MODE_ALL
+        currentPayments, totals = summarizeInvoiceLines(
+            iterInvoiceLines(payments), lineMode
+        )
+        totalExcl = totals["totalExcl"]
+        tax = totals["tax"]
+        total = totals["total"]
 
         components = [
             WordFileTag(
@@ -285,22 +533,114 @@ class Controller(ViktorController):
 
         return components
 
+    def renderStatementWordFile(self, params, entityId: int) -> File:
+        """
+        Render client statement using the statement template, in a single pass.
+        The statement has the layout of an invoice, but no due date, invoice number
+        or payment request: its payments have been invoiced already.
+        """
+        if not checkStatementSetup(params, entity_id=entityId):
+            raise UserError("Kies eerst een klant en periode voor het overzicht")
+        template_dir = pyutils.get_root() / "app" / "lib" / "statement_template.docx"
+        with open(template_dir, "rb") as template:
+            components = self.gatherStatementComponents(params, entityId)
+            result = render_word_file(template, components)
+        return result
+
+    def gatherStatementComponents(self, params, entityId: int) -> list[WordFileTag]:
+        """
+        Gather WordFileTag objects for a client statement over an arbitrary date
+        range. The payments are taken with a single range query and summarized per
+        month with subtotals, instead of gathering the invoices period by period.
+        """
+        statementData = params.statementStep
+        start = statementData.startDate.toordinal()
+        end = statementData.endDate.toordinal()
+
+        # client details, including archived payments of the years in range
+        years = range(statementData.startDate.year, statementData.endDate.year + 1)
+        financeData = loadFinanceData(entityId, years=list(years))
+        clientData = financeData.client(statementData.clientName)
+        clientAddres = Munch(
+            streetAndNumber=clientData.streetAndNumber,
+            postalCode=clientData.postalCode,
+            city=clientData.city,
+        )
+
+        # payment data
+        payments = clientData.payments.between(start, end)
+        lineMode = statementData.get("lineMode") or LINE_MODE_ALL
+        currentPayments, totals = summarizeStatementLines(
+            iterInvoiceLines(payments), lineMode
+        )
+
+        components = [
+            WordFileTag("clientName", rf"{statementData.clientName}"),
+            WordFileTag(
+                "statementDate", statementData.statementDate.strftime(r"%d/%m/%Y")
+            ),
+            WordFileTag(
+                "statementPeriod",
+                f"{convertOrdinalToDate(start)} - {convertOrdinalToDate(end)}",
+            ),
+            WordFileTag("clientLegalContact", rf"{clientData.legalContact}"),
+            WordFileTag("clientAddress", clientAddres),
+            WordFileTag("clientEmail", rf"{clientData.email}"),
+            WordFileTag("payments", currentPayments),
+            WordFileTag("totalExcl", f"{totals['totalExcl']:.2f}"),
+            WordFileTag("tax", f"{totals['tax']:.2f}"),
+            WordFileTag("total", f"{totals['total']:.2f}"),
+        ]
+        return components
+
     def getStorageKey(self, params) -> str:
         """
         Get storage key for invoice
         """
         return f"{params.invoiceStep.clientName}-{params.invoiceStep.invoiceNumber}"
 
-    def getFinanceDataExcel(self, params, **kwargs) -> SpreadsheetResult:
+    def getFinanceDataExcel(self, params, **kwargs) -> dict:
         """
         Load finance data from uploaded excel file. Optionally pass any inputs from user
         (Not implemented yet)
         """
-        inputs = [SpreadsheetCalculationInput("clientName", "")]
         financeFile = Controller.obtainFileFromResource(params.uploadStep.financeSheet)
+        financeData, warnings = Controller.parseFinanceValues(
+            Controller.evaluateFinanceSheet(financeFile)
+        )
+        Controller.reportWarnings(warnings)
+        return financeData
+
+    @staticmethod
+    def evaluateFinanceSheet(financeFile: File) -> dict:
+        """
+        Evaluate finance workbook, returns the raw (";" separated) data strings
+        """
+        inputs = [SpreadsheetCalculationInput("clientName", "")]
         financeSheet = SpreadsheetCalculation(financeFile, inputs)
-        financeData = financeSheet.evaluate(include_filled_file=False).values
-        for itemKey, dataString in financeData.items():
+        return financeSheet.evaluate(include_filled_file=False).values
+
+    @staticmethod
+    def ingestWorkbook(
+        financeFile: File,
+    ) -> tuple[tuple[dict, list[str]], float, float]:
+        """
+        Evaluate and parse a finance workbook, returns the parsed finance data and
+        warnings with the evaluation and parse time (wall time, in seconds)
+        """
+        values, evaluateTime = timed(Controller.evaluateFinanceSheet, financeFile)
+        parsed, parseTime = timed(Controller.parseFinanceValues, values)
+        return parsed, evaluateTime, parseTime
+
+    @staticmethod
+    def parseFinanceValues(financeData: dict) -> tuple[dict, list[str]]:
+        """
+        Parse raw data strings of the finance workbook into sorted finance data.
+        Returns the finance data and the warnings to report, such that parsing can
+        run off the request thread.
+        """
+        financeData = dict(financeData)  # keep raw values intact
+        for itemKey, dataString in list(financeData.items()):
             if isinstance(dataString, str):
                 values = dataString.split(";")
                 valueArray = np.array(values)
@@ -326,9 +666,9 @@ class Controller(ViktorController):
                 "pricesExcl",
                 "quantity",
             ]:  # data is a list of floats
-                floats = valueArray[~empty]
-                valueArray[~empty] = convertExcelFloat(floats).tolist()
-                financeData[itemKey] = valueArray
+                floatArray = np.full(len(valueArray), np.nan)
+                floatArray[~empty] = convertExcelFloat(valueArray[~empty])
+                financeData[itemKey] = floatArray
             elif itemKey == "invoiceDates":  # data is a list of dates
                 values = valueArray.tolist()
                 financeData[itemKey] = []
@@ -357,32 +697,36 @@ class Controller(ViktorController):
         return file
 
     @staticmethod
-    def sortFinanceData(financeData: dict) -> dict:
+    def sortFinanceData(financeData: dict) -> tuple[dict, list[str]]:
         """
-        sort by clients first then by date. This is also the structure of database
+        sort by clients first then by date. This is also the structure of database.
+        Returns the sorted finance data and warnings about incomplete clients.
         """
         sortedFinanceData = {}
+        warnings = []
+        invoiceNumbers = {}
         for client in financeData["availableClients"]:
             sortedFinanceData[client] = {"availableInvoiceNumbers": []}
+            invoiceNumbers[client] = set()
         for i, client in enumerate(financeData["clients"]):
             if client not in financeData["availableClients"]:
                 continue
             date = financeData["invoiceDates"][i]
             invoiceNumber = financeData["invoiceNumbers"][i]
+            if (parsed := InvoiceNumber.parse(invoiceNumber)) is not None:
+                invoiceNumber = parsed.text  # interned
             sortedFinanceData[client][date] = {
-                "priceIncl": financeData["pricesIncl"][i],
-                "priceExcl": financeData["pricesExcl"][i],
+                "priceIncl": formatFinanceFloat(financeData["pricesIncl"][i]),
+                "priceExcl": formatFinanceFloat(financeData["pricesExcl"][i]),
                 "invoiceNumber": invoiceNumber,
-                "quantity": financeData["quantity"][i],
+                "quantity": formatFinanceFloat(financeData["quantity"][i]),
                 "description": financeData["description"][i],
             }
-            if (
-                invoiceNumber
-                not in sortedFinanceData[client]["availableInvoiceNumbers"]
-            ):
-                sortedFinanceData[client]["availableInvoiceNumbers"].append(
-                    financeData["invoiceNumbers"][i]
-                )
+            invoiceNumbers[client].add(invoiceNumber)
+        for client, numbers in invoiceNumbers.items():
+            sortedFinanceData[client]["availableInvoiceNumbers"] = sortInvoiceNumbers(
+                numbers
+            )
         clients = np.array(financeData["availableClients"])
         sortedFinanceData["availableClients"] = clients[clients != "NA"].tolist()
         clientNumbers = np.array(financeData["clientNumbers"])
@@ -417,6 +761,11 @@ class Controller(ViktorController):
                 sortedFinanceData[client]["city"] = clientCity[clientIndex]
                 sortedFinanceData[client]["email"] = clientEmail[clientIndex]
             except IndexError:
-                UserMessage.warning(f"Client {client} is missing contact information")
+                warnings.append(f"Client {client} is missing contact information")
+
+        return sortedFinanceData, warnings
 
-        return sortedFinanceData
+    @staticmethod
+    def reportWarnings(warnings: list[str]) -> None:
+        for warning in warnings:
+            UserMessage.warning(warning)
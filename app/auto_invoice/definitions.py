@@ -1,14 +1,25 @@
 import json
+import zlib
 from calendar import Calendar
 from calendar import month_name as MONTH_NAMES
+from collections import defaultdict
+from concurrent.futures import Future
 from datetime import date as Date
+from functools import lru_cache
 from pprint import pprint
+from threading import Lock
+from time import sleep
+from uuid import uuid4
 
 import numpy as np
 from deep_translator import GoogleTranslator
 from viktor.core import File, Storage, UserMessage
 from viktor.errors import InputViolation, UserError
 
+from app.auto_invoice.finance_data import FinanceData
+from app.auto_invoice.invoice_number import YEAR_BASE, InvoiceNumber
+from app.auto_invoice.search_index import SEARCH_LIMIT, FinanceSearchIndex
+
 MONTH_NAMES = MONTH_NAMES[1:]  # month_names starts with empty string
 
 START_YEAR = 2024
@@ -21,14 +32,75 @@ INVOICE_YEARS = [str(year) for year in range(START_YEAR, START_YEAR + MAX_YEARS)
 
 ORDINAL_BASE_EXCEL = Date(1900, 1, 1).toordinal() - 2
 
+FINANCE_DATA_KEY = "financeData"
+
+FINANCE_DATA_VERSION_KEY = "financeDataVersion"
+
+FINANCE_DATA_REVISION_KEY = "revision"  # revision token inside the stored document
+
+FINANCE_DATA_FINGERPRINT_KEY = "financeDataFingerprint"
+
+FINANCE_DATA_MAX_RETRIES = 5
+
+FINANCE_DATA_RETRY_DELAY = 0.2  # seconds
+
+FINANCE_DATA_METADATA_KEYS = ["availableClients", "clientNumbers"]
+
+# finance data deltas waiting to be written per entity: (deltas, future of the write)
+_pendingFinanceDataWrites = {}
+_pendingFinanceDataLock = Lock()
+
+# one finance data write per entity at a time, deltas submitted meanwhile are
+# written together by the next writer
+_financeDataWriteLocks = defaultdict(Lock)
+
+
+class FinanceDataConflictError(Exception):
+    """
+    Raised when finance data in storage changed since it was read
+    """
+
 
 def getAvailableClients(params, **kwargs):
     """
-    Get list of available clients from finance data
+    Get list of available clients from finance data. If a search query is given,
+    only the best matching clients (on name or client number) are returned.
+    """
+    return searchClientOptions(
+        kwargs.get("entity_id"),
+        params.invoiceStep.get("clientQuery"),
+        params.invoiceStep.get("clientName"),
+    )
+
+
+def getStatementClients(params, **kwargs):
+    """
+    Get list of available clients for the client statement
     """
-    if data := getFinanceDataAttributeFromStorage("availableClients"):
-        return data
-    return []
+    return searchClientOptions(
+        kwargs.get("entity_id"),
+        params.statementStep.get("clientQuery"),
+        params.statementStep.get("clientName"),
+    )
+
+
+def getExportClients(params, **kwargs):
+    """
+    Get list of available clients for the finance data export
+    """
+    return searchClientOptions(
+        kwargs.get("entity_id"),
+        params.exportStep.get("clientQuery"),
+        params.exportStep.get("clientName"),
+    )
+
+
+def searchClientOptions(entityId: int, query: str, selected: str) -> list[str]:
+    if query:
+        clients = loadSearchIndex(entityId).searchClients(query)
+    else:
+        clients = loadFinanceData(entityId).availableClients[:SEARCH_LIMIT]
+    return withSelectedOption(clients, selected)
 
 
 def getAvailableDates(params, **kwargs):
@@ -39,8 +111,7 @@ def getAvailableDates(params, **kwargs):
         UserMessage.info("Please specify a client to get available dates")
         dates = []
     else:
-        clientData = getFinanceDataAttributeFromStorage(client)
-        dates = [date for date in clientData]
+        dates = loadFinanceData(kwargs.get("entity_id")).client(client).payments.dates
     return dates
 
 
@@ -76,7 +147,6 @@ def convertDateToOrdinal(date: str) -> str:
     Convert date to ordinal
     """
     d, m, y = [int(i) for i in date.split("/")]
-    # y = getYearFromYearNr(y)
     return Date(y, m, d).toordinal()
 
 
@@ -87,16 +157,214 @@ def convertExcelFloat(excelFloat: np.ndarray) -> float:
     return np.char.replace(excelFloat, ",", ".").astype(np.float64)
 
 
-def getFinanceDataFromStorage() -> dict:
+def getFinanceDataFromStorage(years: list[int] = None) -> dict:
+    """
+    Get finance data from storage. Only the current (hot) years are included,
+    closed years given in `years` are merged in from their archived segments.
+    """
+    return readFinanceData(years)[0]
+
+
+def readFinanceData(years: list[int] = None) -> tuple[dict, str]:
     """
-    Get finance data from storage
+    Get finance data (see getFinanceDataFromStorage) and the revision stored inside
+    the document, None for documents written before revisions were embedded
     """
     storage = Storage()
-    if "financeData" not in storage.list(scope="entity"):
+    if FINANCE_DATA_KEY not in storage.list(scope="entity"):
         UserMessage.warning("Could not find finance data in storage")
-        return {}
-    financeDataFile = storage.get("financeData", scope="entity")
-    return json.loads(financeDataFile.getvalue())
+        return {}, None
+    financeDataFile = storage.get(FINANCE_DATA_KEY, scope="entity")
+    financeData = json.loads(financeDataFile.getvalue())
+    revision = financeData.pop(FINANCE_DATA_REVISION_KEY, None)
+    for year in years or []:
+        if year >= CURRENT_YEAR:
+            continue
+        for client, rows in getFinanceSegmentFromStorage(year).items():
+            if client in financeData:
+                financeData[client].update(rows)
+    return financeData, revision
+
+
+def getFinanceSegmentKey(year: int) -> str:
+    return f"{FINANCE_DATA_KEY}-{year}"
+
+
+def getFinanceSegmentFromStorage(year: int) -> dict:
+    """
+    Get archived payments ({client: {date: payment}}) of a closed year from storage
+    """
+    return readFinanceSegment(year)[0]
+
+
+def readFinanceSegment(year: int) -> tuple[dict, str]:
+    """
+    Get archived payments of a closed year and the revision of its segment
+    """
+    storage = Storage()
+    key = getFinanceSegmentKey(year)
+    if key not in storage.list(scope="entity"):
+        return {}, "0"
+    segmentFile = storage.get(key, scope="entity")
+    segment = json.loads(zlib.decompress(segmentFile.getvalue_binary()))
+    return segment, segment.pop(FINANCE_DATA_REVISION_KEY, "0")
+
+
+def getFinanceSegmentYears() -> list[int]:
+    """
+    Get the closed years with an archived segment in storage
+    """
+    prefix = getFinanceSegmentKey("")
+    years = []
+    for key in Storage().list(scope="entity"):
+        if key.startswith(prefix) and key[len(prefix) :].isdigit():
+            years.append(int(key[len(prefix) :]))
+    return sorted(years)
+
+
+def saveFinanceSegmentToStorage(year: int, segment: dict, revision: str) -> None:
+    """
+    Save archived payments of a closed year as compressed segment
+    """
+    document = {**segment, FINANCE_DATA_REVISION_KEY: revision}
+    data = zlib.compress(json.dumps(document).encode(), level=9)
+    Storage().set(getFinanceSegmentKey(year), data=File.from_data(data), scope="entity")
+
+
+def getPaymentYear(date: str) -> int:
+    """
+    Get year of a payment date key ("dd/mm/yyyy"), None for client attributes
+    """
+    if "/" not in date:
+        return None
+    return int(date.rsplit("/", 1)[1])
+
+
+def getFinanceDataYears(financeData: dict) -> list[int]:
+    """
+    Get all years with payments in finance data
+    """
+    years = set()
+    for client in financeData.get("availableClients", []):
+        for date in financeData.get(client, {}):
+            if (year := getPaymentYear(date)) is not None:
+                years.add(year)
+    return sorted(years)
+
+
+def splitFinanceDataByYear(financeData: dict) -> tuple[dict, dict]:
+    """
+    Split finance data into hot data (client attributes and payments of the current
+    year onwards) and segments with the payments of each closed year
+    """
+    hotFinanceData = {}
+    segments = {}
+    for key, value in financeData.items():
+        if key in FINANCE_DATA_METADATA_KEYS:
+            hotFinanceData[key] = value
+            continue
+        hotClientData = {}
+        for date, payment in value.items():
+            year = getPaymentYear(date)
+            if year is not None and year < CURRENT_YEAR:
+                segments.setdefault(year, {}).setdefault(key, {})[date] = payment
+            else:
+                hotClientData[date] = payment
+        hotFinanceData[key] = hotClientData
+    return hotFinanceData, segments
+
+
+def compactFinanceSegments(segments: dict) -> None:
+    """
+    Merge payments of closed years into their archived segments, each segment with
+    its own optimistic concurrency: a segment is read, merged and written under a new
+    revision only if its revision did not change meanwhile, and it is read back until
+    it holds all merged payments. Segments that already hold them are not rewritten,
+    so compacting the same payments again is cheap.
+    """
+    for year, segmentDelta in segments.items():
+        for _ in range(FINANCE_DATA_MAX_RETRIES + 1):  # last pass only verifies
+            segment, revision = readFinanceSegment(year)
+            if all(
+                segment.get(client, {}).get(date) == payment
+                for client, payments in segmentDelta.items()
+                for date, payment in payments.items()
+            ):
+                break
+            newSegment = dict(segment)
+            for client, payments in segmentDelta.items():
+                newSegment[client] = {**segment.get(client, {}), **payments}
+            if readFinanceSegment(year)[1] == revision:
+                saveFinanceSegmentToStorage(year, newSegment, getNextRevision(revision))
+        else:
+            raise UserError(
+                f"Could not update finance data of {year}, please try again"
+            )
+
+
+def getFinanceDataRevision() -> str:
+    """
+    Get revision token ("<version>-<writer>") of finance data in storage, "0" if
+    never written. Cheap to read, used as cache key and to detect concurrent writes.
+    """
+    storage = Storage()
+    if FINANCE_DATA_VERSION_KEY not in storage.list(scope="entity"):
+        return "0"
+    return storage.get(FINANCE_DATA_VERSION_KEY, scope="entity").getvalue()
+
+
+def getNextRevision(revision: str) -> str:
+    """
+    Get a new, unique revision token following the given one
+    """
+    version = int(revision.split("-", 1)[0])
+    return f"{version + 1}-{uuid4().hex}"
+
+
+def loadFinanceData(entityId: int, years: list[int] = None) -> FinanceData:
+    """
+    Load typed finance data of an entity, including the archived payments of
+    (closed) years. Loaded data is cached per entity and finance data version, so
+    repeated callbacks do not parse the stored document again. A write claims its
+    revision before storing the document, so data is only cached once the document
+    carries the revision it is cached under.
+    """
+    years = tuple(
+        sorted({int(year) for year in years or [] if int(year) < CURRENT_YEAR})
+    )
+    for _ in range(FINANCE_DATA_MAX_RETRIES):
+        try:
+            return _loadFinanceData(entityId, getFinanceDataRevision(), years)
+        except FinanceDataConflictError:
+            sleep(FINANCE_DATA_RETRY_DELAY)  # document of the revision not written yet
+    # document never caught up with its revision (interrupted write), do not cache
+    return FinanceData.fromJson(getFinanceDataFromStorage(years=list(years)))
+
+
+@lru_cache(maxsize=4)
+def _loadFinanceData(entityId: int, revision: str, years: tuple[int]) -> FinanceData:
+    financeData, documentRevision = readFinanceData(years=list(years))
+    if documentRevision is not None and documentRevision != revision:
+        raise FinanceDataConflictError(
+            f"Finance data document has revision {documentRevision}, not {revision}"
+        )
+    return FinanceData.fromJson(financeData)
+
+
+def loadSearchIndex(entityId: int) -> FinanceSearchIndex:
+    """
+    Load search index over clients and invoice numbers of an entity, cached per
+    entity and finance data version (like loadFinanceData)
+    """
+    try:
+        return _loadSearchIndex(entityId, getFinanceDataRevision())
+    except FinanceDataConflictError:
+        return FinanceSearchIndex.fromFinanceData(loadFinanceData(entityId))
+
+
+@lru_cache(maxsize=2)
+def _loadSearchIndex(entityId: int, revision: str) -> FinanceSearchIndex:
+    return FinanceSearchIndex.fromFinanceData(_loadFinanceData(entityId, revision, ()))
 
 
 def getFinanceDataAttributeFromStorage(key: str) -> dict:
@@ -109,13 +377,168 @@ def getFinanceDataAttributeFromStorage(key: str) -> dict:
     return data
 
 
-def saveFinanceDataToStorage(financeData: dict) -> None:
+def saveFinanceDataToStorage(financeData: dict, expectedRevision: str = None) -> str:
+    """
+    Save finance data to storage under a new revision and return that revision.
+    Storage has no conditional writes, so concurrent writers are detected with
+    revision tokens: the new revision is claimed in the revision file (refused when
+    storage holds another revision than expected), stored inside the document and
+    read back after each write. A mismatch means another writer got in between.
+    """
+    storage = Storage()
+    revision = getFinanceDataRevision()
+    if expectedRevision is not None and revision != expectedRevision:
+        raise FinanceDataConflictError(
+            f"Finance data revision {revision} does not match {expectedRevision}"
+        )
+    newRevision = getNextRevision(revision)
+    storage.set(
+        FINANCE_DATA_VERSION_KEY, data=File.from_data(newRevision), scope="entity"
+    )
+    if getFinanceDataRevision() != newRevision:
+        raise FinanceDataConflictError("Finance data revision claimed by another write")
+
+    document = {**financeData, FINANCE_DATA_REVISION_KEY: newRevision}
+    storage.set(
+        FINANCE_DATA_KEY, data=File.from_data(json.dumps(document)), scope="entity"
+    )
+    storedFile = storage.get(FINANCE_DATA_KEY, scope="entity")
+    if json.loads(storedFile.getvalue()).get(FINANCE_DATA_REVISION_KEY) != newRevision:
+        raise FinanceDataConflictError("Finance data overwritten by another write")
+    return newRevision
+
+
+def getUploadFingerprint() -> dict:
     """
-    Save finance data to storage
+    Get fingerprint ({"file": hash, "sheet": hash}) of the last ingested upload
     """
     storage = Storage()
-    financeDataFile = File.from_data(json.dumps(financeData))
-    storage.set("financeData", data=financeDataFile, scope="entity")
+    if FINANCE_DATA_FINGERPRINT_KEY not in storage.list(scope="entity"):
+        return {}
+    fingerprintFile = storage.get(FINANCE_DATA_FINGERPRINT_KEY, scope="entity")
+    return json.loads(fingerprintFile.getvalue())
+
+
+def saveUploadFingerprint(fileHash: str, sheetHash: str) -> None:
+    """
+    Save fingerprint of the last ingested upload
+    """
+    fingerprint = json.dumps({"file": fileHash, "sheet": sheetHash})
+    Storage().set(
+        FINANCE_DATA_FINGERPRINT_KEY, data=File.from_data(fingerprint), scope="entity"
+    )
+
+
+def getFinanceDataDelta(oldFinanceData: dict, newFinanceData: dict) -> dict:
+    """
+    Get the rows and client attributes in new finance data that differ from old
+    finance data. Returns an empty dict if nothing changed.
+    """
+    delta = {}
+    for client in newFinanceData["availableClients"]:
+        oldClientData = oldFinanceData.get(client, {})
+        clientDelta = {
+            key: value
+            for key, value in newFinanceData.get(client, {}).items()
+            if oldClientData.get(key) != value
+        }
+        if clientDelta:
+            delta[client] = clientDelta
+    for key in FINANCE_DATA_METADATA_KEYS:
+        if delta or oldFinanceData.get(key) != newFinanceData[key]:
+            delta[key] = newFinanceData[key]
+    return delta
+
+
+def applyFinanceDataDelta(financeData: dict, delta: dict) -> dict:
+    """
+    Apply delta to (a copy of) finance data
+    """
+    newFinanceData = dict(financeData)
+    for key, value in delta.items():
+        if key in FINANCE_DATA_METADATA_KEYS:
+            newFinanceData[key] = value
+        else:
+            newFinanceData[key] = {**newFinanceData.get(key, {}), **value}
+    return newFinanceData
+
+
+def combineFinanceDataDeltas(deltas: list[dict]) -> dict:
+    """
+    Combine deltas into one delta. Client data is merged per client (later deltas
+    win per key) and the client lists are united, such that no client of an earlier
+    delta is dropped.
+    """
+    combinedDelta = {}
+    clientNumbers = {}
+    for delta in deltas:
+        for key, value in delta.items():
+            if key not in FINANCE_DATA_METADATA_KEYS:
+                combinedDelta[key] = {**combinedDelta.get(key, {}), **value}
+        clients = delta.get("availableClients", [])
+        numbers = delta.get("clientNumbers", [])
+        for i, client in enumerate(clients):
+            if i < len(numbers):
+                clientNumbers[client] = numbers[i]
+            else:
+                clientNumbers.setdefault(client, "NA")
+    if clientNumbers:
+        combinedDelta["availableClients"] = list(clientNumbers)
+        combinedDelta["clientNumbers"] = list(clientNumbers.values())
+    return combinedDelta
+
+
+def updateFinanceDataInStorage(entityId: int, delta: dict) -> int:
+    """
+    Apply delta to finance data in storage. Writes of an entity run one at a time,
+    deltas submitted while a write is in flight are coalesced into a single next
+    write. Returns once the delta is stored (raising the error of the write that
+    took it otherwise) with the number of attempts needed, 0 if the delta was
+    written by another call.
+    """
+    with _pendingFinanceDataLock:
+        if (batch := _pendingFinanceDataWrites.get(entityId)) is None:
+            batch = _pendingFinanceDataWrites[entityId] = ([], Future())
+        batch[0].append(delta)
+        writeLock = _financeDataWriteLocks[entityId]
+    deltas, future = batch
+    with writeLock:
+        with _pendingFinanceDataLock:
+            if isWriter := (_pendingFinanceDataWrites.get(entityId) is batch):
+                del _pendingFinanceDataWrites[entityId]
+        if isWriter:
+            try:
+                future.set_result(
+                    writeFinanceDataDelta(combineFinanceDataDeltas(deltas))
+                )
+            except Exception as error:
+                future.set_exception(error)
+    attempts = future.result()
+    return attempts if isWriter else 0
+
+
+def writeFinanceDataDelta(delta: dict) -> int:
+    """
+    Apply delta to finance data in storage using optimistic concurrency, a
+    conflicting write is retried by re-applying the delta to the latest data.
+    Payments of closed years are merged into their archived segments before the hot
+    document is written, and the segments are verified again afterwards. Returns
+    the number of attempts needed.
+    """
+    for attempt in range(1, FINANCE_DATA_MAX_RETRIES + 1):
+        revision = getFinanceDataRevision()
+        financeData, segments = splitFinanceDataByYear(
+            applyFinanceDataDelta(getFinanceDataFromStorage(), delta)
+        )
+        compactFinanceSegments(segments)
+        try:
+            saveFinanceDataToStorage(financeData, expectedRevision=revision)
+            # check that no concurrent write dropped payments from the segments
+            compactFinanceSegments(segments)
+            return attempt
+        except FinanceDataConflictError:
+            UserMessage.info("Finance data changed during update, retrying")
+    raise UserError("Could not update finance data, please try again")
 
 
 def getInvoiceYears(params, **kwargs) -> list[str]:
@@ -124,14 +547,14 @@ def getInvoiceYears(params, **kwargs) -> list[str]:
     """
     if (clientName := params.invoiceStep.get("clientName")) is None:
         return []
-    clientData = getFinanceDataAttributeFromStorage(clientName)
+    financeData = loadFinanceData(kwargs.get("entity_id"))
+    if (clientData := financeData.client(clientName)) is None:
+        return []
     years = []
-    if availableInvoiceNumbers := clientData.get("availableInvoiceNumbers"):
-        for invoiceNumber in availableInvoiceNumbers:
-            yearNr = invoiceNumber.split(".")[-1]
-            year = getYearFromYearNr(yearNr)
-            if year not in years and year is not None:
-                years.append(getYearFromYearNr(yearNr))
+    for text in clientData.availableInvoiceNumbers:
+        invoiceNumber = InvoiceNumber.parse(text)
+        if invoiceNumber is not None and invoiceNumber.year not in years:
+            years.append(invoiceNumber.year)
     return years
 
 
@@ -160,22 +583,23 @@ def getInvoiceIndices(params, **kwargs) -> list[str]:
     """
     if (year := params.invoiceStep.get("invoiceYear")) is None:
         return []
-    yearNr = getYearNr(year)
     if (period := params.invoiceStep.get("invoicePeriod")) is None:
         return []
-    periodNr = getPeriodNr(year, params.invoiceStep.get("invoicePeriod"))
+    yearNr = int(year) - YEAR_BASE
+    periodNr = int(getPeriodNr(int(year), period))
     generalErroMsg = "Cannot find invoices"
-    clientData = getFinanceDataAttributeFromStorage(
-        params.invoiceStep.get("clientName")
-    )
+    financeData = loadFinanceData(kwargs.get("entity_id"))
+    clientData = financeData.client(params.invoiceStep.get("clientName"))
     indices = []
-    for invoiceNumber in clientData["availableInvoiceNumbers"]:
-        elements = invoiceNumber.split(".")
-        if len(elements) != 4:
+    for text in clientData.availableInvoiceNumbers if clientData else []:
+        if (invoiceNumber := InvoiceNumber.parse(text)) is None:
             continue
-        _, index, _periodNr, _yearNr = invoiceNumber.split(".")
-        if (_periodNr == periodNr) and (_yearNr == yearNr) and index not in indices:
-            indices.append(index)
+        if (
+            invoiceNumber.periodNr == periodNr
+            and invoiceNumber.yearNr == yearNr
+            and invoiceNumber.index not in indices
+        ):
+            indices.append(invoiceNumber.index)
     if indices == []:
         fields = [
             "clientName",
@@ -206,56 +630,94 @@ def checkInvoiceSetup(params, **kwargs) -> bool:
         return False
 
     # check if client exists in finance data
-    financeData = getFinanceDataFromStorage()
-    if (clientData := financeData.get(params.invoiceStep.clientName)) is None:
+    financeData = loadFinanceData(kwargs.get("entity_id"))
+    if financeData.client(params.invoiceStep.clientName) is None:
         UserMessage.warning("Client not found in finance data")
         return False
 
     return True
 
 
-def getInvoicePeriodFromNumber(invoiceNumber: int) -> tuple[str, int]:
+def checkStatementSetup(params, **kwargs) -> bool:
+    """
+    Check that client and date range of the client statement are set
+    """
+    statementParams = params.statementStep
+    statementSetup = [
+        statementParams.get("clientName"),
+        statementParams.get("startDate"),
+        statementParams.get("endDate"),
+        statementParams.get("statementDate"),
+    ]
+    if None in statementSetup:
+        UserMessage.warning("Missing statement setup parameters")
+        return False
+    if statementParams.startDate > statementParams.endDate:
+        violation = InputViolation(
+            "Start date should be before end date",
+            fields=["statementStep.startDate", "statementStep.endDate"],
+        )
+        raise UserError("Invalid statement period", input_violations=[violation])
+    financeData = loadFinanceData(kwargs.get("entity_id"))
+    if financeData.client(statementParams.clientName) is None:
+        UserMessage.warning("Client not found in finance data")
+        return False
+    return True
+
+
+def getInvoicePeriodFromNumber(invoiceNumber: str) -> tuple[str, str, int]:
     """
     Get invoice period from invoice number
     """
-    indexNr, periodNr, yearNr = invoiceNumber.split(".")[1:]
-    year = getYearFromYearNr(yearNr)
-    periods = generateInvoicePeriods(year)
-    return indexNr, periods[int(periodNr) - 1], year
+    invoiceNumber = InvoiceNumber.parse(invoiceNumber)
+    if invoiceNumber is None:
+        raise UserError("Invalid invoice number")
+    periods = generateInvoicePeriods(invoiceNumber.year)
+    return invoiceNumber.index, periods[invoiceNumber.periodNr - 1], invoiceNumber.year
 
 
 def getInvoiceNumberFromPeriodAndIndex(
-    client: str, index: str, period: str, year: int
+    entityId: int, client: str, index: str, period: str, year: int
 ) -> int:
     """
     Get invoice number from period and year
     """
-    clientNumber = getClientNr(client)
-    periodNr = getPeriodNr(year, period)
-    yearNr = getYearNr(year)
-    return f"{clientNumber}.{index}.{periodNr}.{yearNr}"
+    clientNumber = getClientNr(entityId, client)
+    periodNr = int(getPeriodNr(year, period))
+    return str(InvoiceNumber.fromParts(clientNumber, index, periodNr, int(year)))
 
 
 def getavailableInvoiceNumbers(params, **kwargs) -> list[str]:
     """
     Get list of available invoice numbers from finance data and given client
     """
-    if (
-        clientData := getFinanceDataAttributeFromStorage(
-            params.invoiceStep.get("clientName")
+    clientName = params.invoiceStep.get("clientName")
+    financeData = loadFinanceData(kwargs.get("entity_id"))
+    if (clientData := financeData.client(clientName)) is None:
+        return []
+    if query := params.invoiceStep.get("invoiceNumberQuery"):
+        invoiceNumbers = loadSearchIndex(kwargs.get("entity_id")).searchInvoiceNumbers(
+            clientName, query
         )
-    ) is not None:
-        return clientData["availableInvoiceNumbers"]
-    return []
+    else:  # most recent invoices
+        invoiceNumbers = clientData.availableInvoiceNumbers[-SEARCH_LIMIT:]
+    return withSelectedOption(invoiceNumbers, params.invoiceStep.get("invoiceNumber"))
+
+
+def withSelectedOption(options: list[str], selected: str) -> list[str]:
+    """
+    Make sure the currently selected value stays a valid option
+    """
+    if selected is not None and selected not in options:
+        return [selected, *options]
+    return list(options)
 
 
-def getClientNr(clientName: str) -> str:
+def getClientNr(entityId: int, clientName: str) -> str:
     """
     Get client number
     """
-    clients = getFinanceDataAttributeFromStorage("availableClients")
-    numbers = getFinanceDataAttributeFromStorage("clientNumbers")
-    return numbers[clients.index(clientName)]
+    return loadFinanceData(entityId).clientNumber(clientName)
 
 
 def getPeriodNr(year: int, period: str) -> str:
@@ -268,18 +730,6 @@ def getPeriodNr(year: int, period: str) -> str:
     return periodNr
 
 
-def getYearNr(year: int) -> str:
-    return str(year - 2000)
-
-
-def getYearFromYearNr(yearNr: int | str) -> int:
-    try:
-        yearNr = int(yearNr)
-        return int(yearNr) + 2000
-    except ValueError:
-        return
-
-
 def getPeriodOrdinals(period: int, year: str) -> tuple[int]:
     """
     Get ordinals for start and end of period
@@ -301,7 +751,31 @@ def removeSpecialCharacters(string: str) -> str:
 
 
 def generateInvoiceName(params, fn_ext: str) -> str:
-    invoiceNumberStripped = params.invoiceStep.invoiceNumber.replace(".", "")
+    invoiceNumber = InvoiceNumber.parse(params.invoiceStep.invoiceNumber)
+    if invoiceNumber is None:
+        invoiceNumberStripped = params.invoiceStep.invoiceNumber.replace(".", "")
+    else:
+        invoiceNumberStripped = invoiceNumber.compact
     clientName = params.invoiceStep.clientName
     clientName = removeSpecialCharacters(clientName)
     return f"Factuur_{invoiceNumberStripped}_{clientName}_CALISTRENGTH.{fn_ext}"
+
+
+def generateStatementName(params, fn_ext: str) -> str:
+    statementParams = params.statementStep
+    clientName = removeSpecialCharacters(statementParams.clientName)
+    start = statementParams.startDate.strftime(r"%Y%m%d")
+    end = statementParams.endDate.strftime(r"%Y%m%d")
+    return f"Overzicht_{start}-{end}_{clientName}_CALISTRENGTH.{fn_ext}"
+
+
+def generateExportName(params, fn_ext: str) -> str:
+    exportParams = params.exportStep
+    name = "Finance"
+    if clientName := exportParams.get("clientName"):
+        name += f"_{removeSpecialCharacters(clientName)}"
+    if startDate := exportParams.get("startDate"):
+        name += f"_vanaf{startDate.strftime(r'%Y%m%d')}"
+    if endDate := exportParams.get("endDate"):
+        name += f"_tm{endDate.strftime(r'%Y%m%d')}"
+    return f"{name}_CALISTRENGTH.{fn_ext}"
@@ -0,0 +1,222 @@
+import csv
+import io
+import zipfile
+from functools import lru_cache
+from typing import BinaryIO, Iterator, TextIO
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from app.auto_invoice.definitions import ORDINAL_BASE_EXCEL
+from app.auto_invoice.finance_data import FinanceData, formatOrdinal
+
+EXPORT_COLUMNS = [
+    "client",
+    "clientNumber",
+    "date",
+    "invoiceNumber",
+    "description",
+    "quantity",
+    "priceExcl",
+    "priceIncl",
+]
+
+EXPORT_CHUNK_SIZE = 1024
+
+EXPORT_DATE_CACHE_SIZE = 4096  # formatted dates, about 11 years of days
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="financeData" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    # cell style 1 is the built-in date format (numFmtId 14)
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        "</styleSheet>"
+    ),
+}
+
+
+class StreamWriter:
+    """
+    Write-only stream that keeps track of its own position. Makes zipfile write
+    entries sequentially (with data descriptors) instead of seeking back.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.position += len(data)
+        return self.stream.write(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def iterExportChunks(
+    financeData: FinanceData,
+    clients: list[str] = None,
+    start: int = None,
+    end: int = None,
+) -> Iterator[tuple[str, str, object]]:
+    """
+    Yield (client, client number, payments chunk) for the given clients (all if not
+    given) with start <= ordinal <= end, in chunks of at most EXPORT_CHUNK_SIZE rows
+    """
+    clientNumbers = dict(zip(financeData.availableClients, financeData.clientNumbers))
+    start = -np.inf if start is None else start
+    end = np.inf if end is None else end
+    for client in clients or financeData.availableClients:
+        if (record := financeData.client(client)) is None:
+            continue
+        clientNumber = clientNumbers.get(client, "")
+        payments = record.payments.between(start, end)
+        for i in range(0, len(payments), EXPORT_CHUNK_SIZE):
+            yield client, clientNumber, payments[i : i + EXPORT_CHUNK_SIZE]
+
+
+def iterExportRows(chunks: Iterator[tuple]) -> Iterator[list[tuple]]:
+    """
+    Convert payment chunks into lists of export rows (see EXPORT_COLUMNS), NaN
+    values are exported as empty cells
+    """
+    for client, clientNumber, payments in chunks:
+        yield [
+            (client, clientNumber, *row)
+            for row in zip(
+                payments.ordinal.tolist(),
+                payments.invoiceNumber.tolist(),
+                payments.description.tolist(),
+                *(
+                    np.where(np.isnan(column), None, column).tolist()
+                    for column in [
+                        payments.quantity,
+                        payments.priceExcl,
+                        payments.priceIncl,
+                    ]
+                ),
+            )
+        ]
+
+
+def writeFinanceCsv(chunks: Iterator[tuple], stream: TextIO) -> int:
+    """
+    Write payment chunks as CSV, returns the number of rows written. Each chunk is
+    formatted in a small buffer and written to the stream at once.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for rows in iterExportRows(chunks):
+        for client, number, ordinal, *values in rows:
+            writer.writerow((client, number, formatExportDate(ordinal), *values))
+        stream.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+        count += len(rows)
+    stream.write(buffer.getvalue())
+    return count
+
+
+def formatXlsxCell(value, style: int = 0) -> str:
+    if value is None:
+        return "<c/>"
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{escape(value)}</t></is></c>'
+    if style:
+        return f'<c s="{style}"><v>{value}</v></c>'
+    return f"<c><v>{value!r}</v></c>"
+
+
+def formatXlsxRow(values) -> str:
+    return f"<row>{''.join(values)}</row>"
+
+
+@lru_cache(maxsize=EXPORT_DATE_CACHE_SIZE)
+def formatExportDate(ordinal: int) -> str:
+    return formatOrdinal(ordinal)
+
+
+@lru_cache(maxsize=EXPORT_DATE_CACHE_SIZE)
+def formatXlsxDateCell(ordinal: int) -> str:
+    return formatXlsxCell(ordinal - ORDINAL_BASE_EXCEL, style=1)
+
+
+def writeFinanceXlsx(chunks: Iterator[tuple], stream: BinaryIO) -> int:
+    """
+    Write payment chunks as xlsx. The worksheet XML is streamed into the zip archive
+    chunk by chunk, using inline strings such that no shared string table has to be
+    kept in memory. Returns the number of rows written.
+    """
+    count = 0
+    with zipfile.ZipFile(StreamWriter(stream), "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>"
+            )
+            header = formatXlsxRow(formatXlsxCell(column) for column in EXPORT_COLUMNS)
+            sheet.write(header.encode())
+            clientCells = None  # (client, number) -> cells, constant within a chunk
+            for rows in iterExportRows(chunks):
+                xml = []
+                for client, number, ordinal, *values in rows:
+                    if clientCells is None or clientCells[0] != (client, number):
+                        cells = formatXlsxCell(client) + formatXlsxCell(number)
+                        clientCells = ((client, number), cells)
+                    xml += [
+                        "<row>",
+                        clientCells[1],
+                        formatXlsxDateCell(ordinal),
+                        *map(formatXlsxCell, values),
+                        "</row>",
+                    ]
+                sheet.write("".join(xml).encode())
+                count += len(rows)
+            sheet.write(b"</sheetData></worksheet>")
+    return count
@@ -0,0 +1,256 @@
+from datetime import date as Date
+from functools import lru_cache
+from sys import getsizeof, intern
+
+import numpy as np
+
+FINANCE_NA = "NA"
+
+CLIENT_ATTRIBUTES = ["legalContact", "streetAndNumber", "postalCode", "city", "email"]
+
+PAYMENT_FLOAT_FIELDS = ["priceIncl", "priceExcl", "quantity"]
+
+PAYMENT_STRING_FIELDS = ["invoiceNumber", "description"]
+
+
+def parseFinanceFloat(value) -> float:
+    """
+    Parse stored finance number ("12.5" or "NA") to float, NaN if not available
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def formatFinanceFloat(value: float) -> str:
+    """
+    Format finance number as stored in the JSON layout ("NA" if not available)
+    """
+    value = float(value)
+    return FINANCE_NA if np.isnan(value) else repr(value)
+
+
+@lru_cache(maxsize=4096)  # stored numbers repeat heavily
+def isCanonicalFinanceFloat(text) -> bool:
+    """
+    Check whether stored number text is exactly what formatFinanceFloat writes for
+    its value (e.g. "5.0" and "NA", but not "5" or "5.00")
+    """
+    if text == FINANCE_NA:
+        return True
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        return False
+    return value == value and repr(value) == text
+
+
+def formatOrdinal(ordinal: int) -> str:
+    return Date.fromordinal(int(ordinal)).strftime(r"%d/%m/%Y")
+
+
+def parseDate(date: str) -> int:
+    """
+    Parse payment date key ("dd/mm/yyyy") to ordinal, None for other keys
+    """
+    if "/" not in date:
+        return None
+    d, m, y = date.split("/")
+    return Date(int(y), int(m), int(d)).toordinal()
+
+
+class Payments:
+    """
+    Payments of a single client as numpy columns, sorted by date
+    """
+
+    __slots__ = ["ordinal", *PAYMENT_FLOAT_FIELDS, *PAYMENT_STRING_FIELDS]
+
+    def __init__(
+        self,
+        ordinal: np.ndarray,
+        priceIncl: np.ndarray,
+        priceExcl: np.ndarray,
+        quantity: np.ndarray,
+        invoiceNumber: np.ndarray,
+        description: np.ndarray,
+    ):
+        self.ordinal = ordinal
+        self.priceIncl = priceIncl
+        self.priceExcl = priceExcl
+        self.quantity = quantity
+        self.invoiceNumber = invoiceNumber
+        self.description = description
+
+    @classmethod
+    def fromRows(cls, rows: list[tuple[int, dict]]):
+        """
+        Build columns from (ordinal, payment dict) rows in the JSON layout
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+        ordinal = np.fromiter((row[0] for row in rows), np.int32, len(rows))
+        columns = {}
+        for field in PAYMENT_FLOAT_FIELDS:
+            columns[field] = np.fromiter(
+                (parseFinanceFloat(row[1].get(field)) for row in rows),
+                np.float64,
+                len(rows),
+            )
+        for field in PAYMENT_STRING_FIELDS:
+            column = np.empty(len(rows), dtype=object)
+            column[:] = [intern(str(row[1].get(field, FINANCE_NA))) for row in rows]
+            columns[field] = column
+        return cls(ordinal, **columns)
+
+    def toRows(self) -> dict:
+        """
+        Convert columns back to {date: payment dict} in the JSON layout
+        """
+        rows = {}
+        for i, ordinal in enumerate(self.ordinal.tolist()):
+            rows[formatOrdinal(ordinal)] = {
+                "priceIncl": formatFinanceFloat(self.priceIncl[i]),
+                "priceExcl": formatFinanceFloat(self.priceExcl[i]),
+                "invoiceNumber": self.invoiceNumber[i],
+                "quantity": formatFinanceFloat(self.quantity[i]),
+                "description": self.description[i],
+            }
+        return rows
+
+    def between(self, start: int, end: int):
+        """
+        Payments with start <= ordinal <= end (views, no copies)
+        """
+        i = np.searchsorted(self.ordinal, start, side="left")
+        j = np.searchsorted(self.ordinal, end, side="right")
+        return self[i:j]
+
+    def __getitem__(self, index):
+        return Payments(*(getattr(self, field)[index] for field in self.__slots__))
+
+    def __len__(self) -> int:
+        return len(self.ordinal)
+
+    @property
+    def dates(self) -> list[str]:
+        return [formatOrdinal(ordinal) for ordinal in self.ordinal.tolist()]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, field).nbytes for field in self.__slots__)
+
+
+class ClientRecord:
+    """
+    Client attributes, invoice numbers and payments of a single client
+    """
+
+    __slots__ = [
+        "name",
+        "availableInvoiceNumbers",
+        *CLIENT_ATTRIBUTES,
+        "payments",
+        "extra",
+        "numberTexts",
+    ]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.availableInvoiceNumbers = []
+        for attribute in CLIENT_ATTRIBUTES:
+            setattr(self, attribute, None)
+        self.payments = Payments.fromRows([])
+        self.extra = {}  # unknown keys, kept as is for lossless conversion
+        # {date: {field: text}} of stored numbers that do not round trip through
+        # float (e.g. "5"), None for absent fields, for lossless conversion
+        self.numberTexts = {}
+
+    @classmethod
+    def fromJson(cls, name: str, clientData: dict):
+        record = cls(name)
+        rows = []
+        for key, value in clientData.items():
+            if key == "availableInvoiceNumbers":
+                record.availableInvoiceNumbers = [intern(str(v)) for v in value]
+            elif key in CLIENT_ATTRIBUTES:
+                setattr(record, key, value)
+            elif (ordinal := parseDate(key)) is not None:
+                rows.append((ordinal, value))
+                for field in PAYMENT_FLOAT_FIELDS:
+                    if not isCanonicalFinanceFloat(text := value.get(field)):
+                        record.numberTexts.setdefault(key, {})[field] = text
+            else:
+                record.extra[key] = value
+        record.payments = Payments.fromRows(rows)
+        return record
+
+    def toJson(self) -> dict:
+        clientData = {"availableInvoiceNumbers": list(self.availableInvoiceNumbers)}
+        rows = self.payments.toRows()
+        for date, texts in self.numberTexts.items():
+            payment = rows[date]
+            for field, text in texts.items():
+                if text is None:
+                    del payment[field]
+                else:
+                    payment[field] = text
+        clientData.update(rows)
+        clientData.update(self.extra)
+        for attribute in CLIENT_ATTRIBUTES:
+            if (value := getattr(self, attribute)) is not None:
+                clientData[attribute] = value
+        return clientData
+
+
+class FinanceData:
+    """
+    Typed in-memory finance data. Converts losslessly from and to the JSON layout
+    stored in entity storage: {client: {date: payment, ...}, availableClients, clientNumbers}
+    """
+
+    __slots__ = ["clients", "availableClients", "clientNumbers"]
+
+    def __init__(self):
+        self.clients = {}
+        self.availableClients = []
+        self.clientNumbers = []
+
+    @classmethod
+    def fromJson(cls, financeData: dict):
+        data = cls()
+        for key, value in financeData.items():
+            if key == "availableClients":
+                data.availableClients = list(value)
+            elif key == "clientNumbers":
+                data.clientNumbers = list(value)
+            else:
+                data.clients[key] = ClientRecord.fromJson(key, value)
+        return data
+
+    def toJson(self) -> dict:
+        financeData = {name: record.toJson() for name, record in self.clients.items()}
+        financeData["availableClients"] = list(self.availableClients)
+        financeData["clientNumbers"] = list(self.clientNumbers)
+        return financeData
+
+    def client(self, name: str) -> ClientRecord:
+        return self.clients.get(name)
+
+    def clientNumber(self, name: str) -> str:
+        return self.clientNumbers[self.availableClients.index(name)]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory footprint: payment columns plus the (interned, hence
+        counted once) strings they refer to
+        """
+        total = 0
+        strings = set()
+        for record in self.clients.values():
+            total += getsizeof(record) + record.payments.nbytes
+            for field in PAYMENT_STRING_FIELDS:
+                strings.update(getattr(record.payments, field).tolist())
+            strings.update(record.availableInvoiceNumbers)
+        return total + sum(getsizeof(string) for string in strings)
@@ -0,0 +1,185 @@
+import io
+import zipfile
+from hashlib import sha256
+from heapq import merge
+from itertools import groupby
+from time import perf_counter
+from typing import Callable, Iterator, NamedTuple
+from xml.etree.ElementTree import iterparse
+
+from app.auto_invoice.finance_data import parseDate
+from app.auto_invoice.invoice_number import sortInvoiceNumbers
+
+METADATA_KEYS = ["availableClients", "clientNumbers"]
+
+XLSX_WORKBOOK = "xl/workbook.xml"
+XLSX_SHARED_STRINGS = "xl/sharedStrings.xml"
+XLSX_WORKSHEETS = "xl/worksheets/"
+
+
+class MergeReport(NamedTuple):
+    duplicates: int
+    conflicts: list[tuple[str, str, list[str]]]  # (client, date, file names)
+
+
+def timed(function: Callable, *args) -> tuple[object, float]:
+    """
+    Call function and return its result with the elapsed (wall) time in seconds
+    """
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def hashFiles(files: list) -> str:
+    """
+    Content fingerprint of uploaded file(s)
+    """
+    digest = sha256()
+    for file in files:
+        digest.update(sha256(file.getvalue_binary()).digest())
+    return digest.hexdigest()
+
+
+def hashWorkbookValues(files: list) -> str:
+    """
+    Fingerprint of the cell contents (formulas and values) of uploaded workbook(s),
+    read from the xlsx archive without evaluating it. Styles are ignored, such that
+    workbooks with only formatting changes give the same fingerprint.
+    """
+    digest = sha256()
+    for file in files:
+        with zipfile.ZipFile(io.BytesIO(file.getvalue_binary())) as archive:
+            names = archive.namelist()
+            sharedStrings = []
+            if XLSX_SHARED_STRINGS in names:
+                sharedStrings = readSharedStrings(archive)
+            for element in iterXmlElements(archive, XLSX_WORKBOOK):
+                if element.tag in ["sheet", "definedName"]:
+                    digest.update(f"{element.get('name')}={element.text}\x1e".encode())
+            worksheets = sorted(
+                name
+                for name in names
+                if name.startswith(XLSX_WORKSHEETS) and name.endswith(".xml")
+            )
+            for name in worksheets:
+                digest.update(f"{name}\x1d".encode())
+                for text in iterCellValues(archive, name, sharedStrings):
+                    digest.update(text.encode())
+    return digest.hexdigest()
+
+
+def iterXmlElements(archive: zipfile.ZipFile, name: str) -> Iterator:
+    """
+    Stream the elements of an archived XML part, with namespaces stripped from the
+    tags. Elements are cleared after use, so only their text should be kept.
+    """
+    with archive.open(name) as stream:
+        for _, element in iterparse(stream):
+            element.tag = element.tag.rpartition("}")[2]
+            yield element
+            if element.tag in ["c", "si", "row"]:
+                element.clear()
+
+
+def readSharedStrings(archive: zipfile.ZipFile) -> list[str]:
+    """
+    Shared string table of a workbook, the text of rich text runs is concatenated
+    """
+    strings = []
+    for element in iterXmlElements(archive, XLSX_SHARED_STRINGS):
+        if element.tag == "si":
+            strings.append("".join(element.itertext()))
+    return strings
+
+
+def iterCellValues(
+    archive: zipfile.ZipFile, name: str, sharedStrings: list[str]
+) -> Iterator[str]:
+    """
+    Yield "reference|type|formula|value" for each cell of a worksheet, with shared
+    strings resolved to their text
+    """
+    for element in iterXmlElements(archive, name):
+        if element.tag != "c":
+            continue
+        cellType = element.get("t", "n")
+        formula = value = ""
+        for child in element:
+            if child.tag == "f":
+                formula = child.text or ""
+            elif child.tag == "v":
+                value = child.text or ""
+            elif child.tag == "is":
+                value = "".join(child.itertext())
+        if cellType == "s" and value:
+            value = sharedStrings[int(value)]
+        yield f"{element.get('r')}|{cellType}|{formula}|{value}\x1e"
+
+
+def iterFinanceRows(financeData: dict, fileIndex: int) -> Iterator[tuple]:
+    """
+    Yield (client, ordinal, fileIndex, date, payment) rows sorted by client and date
+    """
+    clients = sorted(key for key in financeData if key not in METADATA_KEYS)
+    for client in clients:
+        rows = []
+        for date, payment in financeData[client].items():
+            if (ordinal := parseDate(date)) is not None:
+                rows.append((ordinal, date, payment))
+        rows.sort(key=lambda row: row[0])
+        for ordinal, date, payment in rows:
+            yield client, ordinal, fileIndex, date, payment
+
+
+def mergeFinanceData(
+    financeDatas: list[dict], names: list[str]
+) -> tuple[dict, MergeReport]:
+    """
+    Merge finance data of several workbooks with a k-way merge over their rows
+    sorted by client and date. Identical rows in several files are counted as
+    duplicates, differing rows are reported as conflicts (the last file wins).
+    """
+    merged = {}
+    duplicates = 0
+    conflicts = []
+    streams = [iterFinanceRows(data, i) for i, data in enumerate(financeDatas)]
+    for (client, _), group in groupby(merge(*streams), key=lambda row: row[:2]):
+        group = list(group)
+        *_, date, payment = group[-1]
+        if len(group) > 1:
+            if all(row[4] == payment for row in group):
+                duplicates += len(group) - 1
+            else:
+                conflicts.append((client, date, [names[row[2]] for row in group]))
+        merged.setdefault(client, {})[date] = payment
+
+    # client attributes, later files override earlier ones
+    availableClients = []
+    clientNumbers = {}
+    invoiceNumbers = {}
+    for data in financeDatas:
+        for client, number in zip(data["availableClients"], data["clientNumbers"]):
+            clientNumbers[client] = number
+        for client in data["availableClients"]:
+            clientNumbers.setdefault(client, "NA")
+            if client not in invoiceNumbers:
+                availableClients.append(client)
+                invoiceNumbers[client] = set()
+        for client, clientData in data.items():
+            if client in METADATA_KEYS:
+                continue
+            clientDataMerged = merged.setdefault(client, {})
+            for key, value in clientData.items():
+                if key == "availableInvoiceNumbers":
+                    invoiceNumbers.setdefault(client, set()).update(value)
+                elif parseDate(key) is None:
+                    clientDataMerged[key] = value
+
+    for client, numbers in invoiceNumbers.items():
+        merged.setdefault(client, {})["availableInvoiceNumbers"] = sortInvoiceNumbers(
+            numbers
+        )
+    merged["availableClients"] = availableClients
+    merged["clientNumbers"] = [clientNumbers[client] for client in availableClients]
+    return merged, MergeReport(duplicates, conflicts)
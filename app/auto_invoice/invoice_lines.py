@@ -0,0 +1,169 @@
+from datetime import date as Date
+from typing import Iterable, Iterator, NamedTuple
+
+import numpy as np
+from viktor.errors import UserError
+
+from app.auto_invoice.finance_data import Payments, formatOrdinal
+
+LINE_MODE_ALL = "Alle regels"
+LINE_MODE_DESCRIPTION = "Groeperen per omschrijving"
+LINE_MODE_WEEK = "Groeperen per week"
+
+LINE_MODES = [LINE_MODE_ALL, LINE_MODE_DESCRIPTION, LINE_MODE_WEEK]
+
+LINE_CHUNK_SIZE = 512
+
+
+class InvoiceLine(NamedTuple):
+    date: str
+    ordinal: int
+    quantity: float
+    subtotal: float
+    priceIncl: float
+    description: str
+
+
+def iterInvoiceLines(payments: Payments) -> Iterator[InvoiceLine]:
+    """
+    Lazily yield invoice lines from payment columns, converting them chunk by chunk.
+    Payments with a missing ("NA") quantity or price cannot be invoiced.
+    """
+    for i in range(0, len(payments), LINE_CHUNK_SIZE):
+        chunk = payments[i : i + LINE_CHUNK_SIZE]
+        missing = (
+            np.isnan(chunk.quantity)
+            | np.isnan(chunk.priceExcl)
+            | np.isnan(chunk.priceIncl)
+        )
+        if missing.any():
+            date = formatOrdinal(chunk.ordinal[np.argmax(missing)])
+            raise UserError(f"Missing quantity or price for payment on {date}")
+        for ordinal, quantity, priceExcl, priceIncl, description in zip(
+            chunk.ordinal.tolist(),
+            chunk.quantity.tolist(),
+            chunk.priceExcl.tolist(),
+            chunk.priceIncl.tolist(),
+            chunk.description.tolist(),
+        ):
+            yield InvoiceLine(
+                formatOrdinal(ordinal),
+                ordinal,
+                quantity,
+                priceExcl,
+                priceIncl,
+                description,
+            )
+
+
+def formatInvoiceRow(
+    date: str, quantity: float, subtotal: float, priceIncl: float, description: str
+) -> dict:
+    """
+    Format a (possibly aggregated) invoice line as a row of the payments table. Lines
+    without quantity or subtotal (e.g. free of charge) get a price and tax rate of 0.
+    """
+    taxrate = (priceIncl - subtotal) / subtotal * 100 if subtotal else 0.0
+    price = subtotal / quantity if quantity else 0.0
+    return {
+        "date": date,
+        "quantity": f"{quantity:.1f}",
+        "price": f"{price:.2f}",
+        "total": f"{subtotal:.2f}",
+        "taxRate": f"{taxrate:.0f}",
+        "description": description,
+    }
+
+
+def summarizeInvoiceLines(
+    lines: Iterable[InvoiceLine], mode: str = LINE_MODE_ALL
+) -> tuple[list[dict], dict]:
+    """
+    Consume invoice lines in a single pass and return the rows of the payments table
+    together with the invoice totals. In the grouped modes only one accumulator per
+    group is kept, so the table (and memory) scales with the number of groups
+    instead of the number of lines. The totals include the total quantity.
+    """
+    totals = {"quantity": 0.0, "totalExcl": 0.0, "tax": 0.0, "total": 0.0}
+    rows = []
+    groups = {}
+    for line in lines:
+        totals["quantity"] += line.quantity
+        totals["totalExcl"] += line.subtotal
+        totals["tax"] += line.priceIncl - line.subtotal
+        totals["total"] += line.priceIncl
+        if mode == LINE_MODE_ALL:
+            rows.append(
+                formatInvoiceRow(
+                    line.date,
+                    line.quantity,
+                    line.subtotal,
+                    line.priceIncl,
+                    line.description,
+                )
+            )
+            continue
+        if mode == LINE_MODE_DESCRIPTION:
+            key = (line.description,)
+        elif mode == LINE_MODE_WEEK:
+            isoYear, week, _ = Date.fromordinal(line.ordinal).isocalendar()
+            key = (isoYear, week, line.description)
+        else:
+            raise ValueError(f"Unknown invoice line mode {mode}")
+        if (group := groups.get(key)) is None:
+            groups[key] = [
+                line.ordinal,
+                line.ordinal,
+                line.quantity,
+                line.subtotal,
+                line.priceIncl,
+            ]
+        else:
+            group[0] = min(group[0], line.ordinal)
+            group[1] = max(group[1], line.ordinal)
+            group[2] += line.quantity
+            group[3] += line.subtotal
+            group[4] += line.priceIncl
+
+    if mode == LINE_MODE_DESCRIPTION:
+        for (description,), group in groups.items():
+            rows.append(
+                formatInvoiceRow(
+                    formatDateRange(group[0], group[1]), *group[2:], description
+                )
+            )
+    elif mode == LINE_MODE_WEEK:
+        weekSubtotal = None
+        for key in sorted(groups):
+            isoYear, week, description = key
+            if weekSubtotal is not None and weekSubtotal[0] != (isoYear, week):
+                rows.append(formatWeekSubtotal(*weekSubtotal))
+                weekSubtotal = None
+            group = groups[key]
+            rows.append(
+                formatInvoiceRow(
+                    formatDateRange(group[0], group[1]), *group[2:], description
+                )
+            )
+            if weekSubtotal is None:
+                weekSubtotal = [(isoYear, week), 0.0, 0.0, 0.0]
+            weekSubtotal[1] += group[2]
+            weekSubtotal[2] += group[3]
+            weekSubtotal[3] += group[4]
+        if weekSubtotal is not None:
+            rows.append(formatWeekSubtotal(*weekSubtotal))
+    return rows, totals
+
+
+def formatWeekSubtotal(
+    isoWeek: tuple[int, int], quantity: float, subtotal: float, priceIncl: float
+) -> dict:
+    _, week = isoWeek
+    return formatInvoiceRow("", quantity, subtotal, priceIncl, f"Subtotaal week {week}")
+
+
+def formatDateRange(startOrdinal: int, endOrdinal: int) -> str:
+    start = Date.fromordinal(startOrdinal).strftime(r"%d/%m/%Y")
+    if startOrdinal == endOrdinal:
+        return start
+    return f"{start} - {Date.fromordinal(endOrdinal).strftime(r'%d/%m/%Y')}"
@@ -0,0 +1,142 @@
+from functools import total_ordering
+from sys import intern
+
+YEAR_BASE = 2000
+
+PERIODS_PER_YEAR = 12
+
+INTERN_LIMIT = 100_000  # interned numbers kept before the table is reset
+
+
+@total_ordering
+class InvoiceNumber:
+    """
+    Parsed invoice number of the form `client.index.period.year`, e.g. `12.1.03.24`.
+    Instances are interned per text, so parsing the same number twice returns the
+    same object. Numbers order chronologically (year, period) and then by client
+    and index, which makes a sorted list of them range-scannable per period.
+    Equality is on the text, so differently formatted numbers (`12.1.03.24` and
+    `12.01.3.24`) are different invoice numbers.
+    """
+
+    __slots__ = ("text", "clientNr", "index", "periodNr", "yearNr", "key", "_hash")
+
+    _interned: dict = {}
+
+    def __init__(
+        self, clientNr: str, index: str, periodNr: int, yearNr: int, text=None
+    ):
+        self.clientNr = intern(str(clientNr))
+        self.index = intern(str(index))
+        self.periodNr = int(periodNr)
+        self.yearNr = int(yearNr)
+        if not 1 <= self.periodNr <= PERIODS_PER_YEAR:
+            raise ValueError(f"Invalid invoice period {self.periodNr}")
+        if text is None:
+            text = f"{self.clientNr}.{self.index}.{self.periodNr:02d}.{self.yearNr}"
+        self.text = intern(text)
+        self.key = (
+            self.yearNr,
+            self.periodNr,
+            naturalKey(self.clientNr),
+            naturalKey(self.index),
+            self.text,
+        )
+        self._hash = hash(self.text)
+
+    @classmethod
+    def parse(cls, text: str):
+        """
+        Parse invoice number text, returns None for malformed numbers (e.g. "NA",
+        "1.1.-3.24" or "1.1.13.24")
+        """
+        if isinstance(text, cls):
+            return text
+        if (invoiceNumber := cls._interned.get(text)) is not None:
+            return invoiceNumber
+        elements = str(text).split(".")
+        if len(elements) != 4:
+            return None
+        clientNr, index, periodNr, yearNr = elements
+        if not (clientNr.isalnum() and index.isalnum()):
+            return None
+        if not (periodNr.isdigit() and yearNr.isdigit()):
+            return None
+        try:
+            invoiceNumber = cls(clientNr, index, int(periodNr), int(yearNr), text)
+        except ValueError:
+            return None
+        return cls.intern(invoiceNumber)
+
+    @classmethod
+    def fromParts(cls, clientNr: str, index: str, periodNr: int, year: int):
+        """
+        Build (interned) invoice number from its parts and a full year
+        """
+        invoiceNumber = cls(clientNr, index, periodNr, int(year) - YEAR_BASE)
+        return cls._interned.get(invoiceNumber.text) or cls.intern(invoiceNumber)
+
+    @classmethod
+    def intern(cls, invoiceNumber):
+        """
+        Keep invoice number for reuse. The table is reset when it reaches
+        INTERN_LIMIT entries, such that it stays bounded in long running workers.
+        """
+        if len(cls._interned) >= INTERN_LIMIT:
+            cls._interned.clear()
+        cls._interned[invoiceNumber.text] = invoiceNumber
+        return invoiceNumber
+
+    @property
+    def year(self) -> int:
+        return self.yearNr + YEAR_BASE
+
+    @property
+    def paddedPeriodNr(self) -> str:
+        return f"{self.periodNr:02d}"
+
+    @property
+    def compact(self) -> str:
+        """
+        Invoice number without separators, used in file names
+        """
+        return self.text.replace(".", "")
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"InvoiceNumber({self.text!r})"
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, InvoiceNumber):
+            return NotImplemented
+        return self.text == other.text
+
+    def __lt__(self, other) -> bool:
+        if not isinstance(other, InvoiceNumber):
+            return NotImplemented
+        return self.key < other.key
+
+
+def naturalKey(value: str) -> tuple:
+    """
+    Sort numeric strings numerically and all other strings after them
+    """
+    return (0, int(value), "") if value.isdigit() else (1, 0, value)
+
+
+def sortInvoiceNumbers(invoiceNumbers) -> list[str]:
+    """
+    Sort invoice number texts; malformed numbers are placed at the end
+    """
+    valid, invalid = [], []
+    for text in invoiceNumbers:
+        if (invoiceNumber := InvoiceNumber.parse(text)) is None:
+            invalid.append(text)
+        else:
+            valid.append(invoiceNumber)
+    return [str(invoiceNumber) for invoiceNumber in sorted(valid)] + sorted(invalid)
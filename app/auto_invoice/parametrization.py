@@ -7,24 +7,32 @@ from viktor.parametrization import (
     IsNotEqual,
     LineBreak,
     Lookup,
+    MultiFileField,
     OptionField,
     SetParamsButton,
     Step,
     Text,
+    TextField,
     ViktorParametrization,
 )
 
 from app.auto_invoice.definitions import (
     getAvailableClients,
+    getExportClients,
+    getStatementClients,
     getavailableInvoiceNumbers,
     getInvoiceIndices,
     getInvoicePeriods,
     getInvoiceYears,
 )
+from app.auto_invoice.invoice_lines import LINE_MODE_ALL, LINE_MODES
+from app.auto_invoice.pdf_preview import PREVIEW_MODE_FAST, PREVIEW_MODES
 
 
 class Parametrization(ViktorParametrization):
-    uploadStep = Step("Upload finance xlsx", views=["viewFinanceData"])
+    uploadStep = Step(
+        "Upload finance xlsx", views=["viewFinanceData", "viewReconciliation"]
+    )
     uploadStep.intro = Text(
         "# CALISTRENGTH: auto invoice app 💰 \n Upload hieronder de meest recente versie van de finance excel"
     )
@@ -34,6 +42,16 @@ class Parametrization(ViktorParametrization):
     uploadStep.updateFinanceDataButton = ActionButton(
         "Update finance data", method="updateFinanceData"
     )
+    uploadStep.multiIntro = Text(
+        "Of upload de finance excels van meerdere coaches tegelijk, deze worden samengevoegd"
+    )
+    uploadStep.financeSheets = MultiFileField(
+        "Finance (xlsx), meerdere bestanden", file_types=[".xlsx"], max_size=5_000_000
+    )
+    uploadStep.updateFinanceDataFromWorkbooksButton = ActionButton(
+        "Update finance data (meerdere bestanden)",
+        method="updateFinanceDataFromWorkbooks",
+    )
 
     invoiceStep = Step("Genereer factuur", views=["viewInvoice"])
     invoiceStep.intro = Text(
@@ -43,6 +61,10 @@ class Parametrization(ViktorParametrization):
     invoiceStep.subheader0 = Text(
         "## Zoek naar factuur\nKies eerst de klant en zoekmethode\n"
     )
+    invoiceStep.clientQuery = TextField(
+        "Zoek klant",
+        description="Zoek op (een deel van) de klantnaam of het klantnummer",
+    )
     invoiceStep.clientName = OptionField("Klantnaam", options=getAvailableClients)
     invoiceStep.searchMethod = OptionField(
         "Hoe wilt u zoeken?",
@@ -52,6 +74,10 @@ class Parametrization(ViktorParametrization):
         visible=IsNotEqual(Lookup("invoiceStep.clientName"), None),
     )
     invoiceStep.lb1 = LineBreak()
+    invoiceStep.invoiceNumberQuery = TextField(
+        "Zoek factuurnummer",
+        visible=IsEqual(Lookup("invoiceStep.searchMethod"), "Factuurnummer"),
+    )
     invoiceStep.invoiceNumber = OptionField(
         "Factuurnummer",
         options=getavailableInvoiceNumbers,
@@ -76,6 +102,12 @@ class Parametrization(ViktorParametrization):
     )
     invoiceStep.lb2 = LineBreak()
     invoiceStep.invoiceDate = DateField("Geef factuurdatum op")
+    invoiceStep.lineMode = OptionField(
+        "Factuurregels",
+        LINE_MODES,
+        default=LINE_MODE_ALL,
+        description="Groepeer factuurregels voor klanten met veel sessies per periode",
+    )
     # TODO: add dynamic array field for invoice items
     invoiceStep.lb3 = LineBreak()
     invoiceStep.setupInvoiceText = Text(
@@ -86,6 +118,13 @@ class Parametrization(ViktorParametrization):
     invoiceStep.setupInvoiceButton = SetParamsButton(
         "Factuur opstellen", method="setupInvoice"
     )
+    invoiceStep.previewMode = OptionField(
+        "Weergave in PDF viewer",
+        PREVIEW_MODES,
+        default=PREVIEW_MODE_FAST,
+        variant="radio-inline",
+        description="Het snelle voorbeeld wordt direct opgemaakt, de downloads gebruiken altijd het officiele document",
+    )
     invoiceStep.subheader1 = Text(r"## Opslaan \& downloaden" + "\n")
     invoiceStep.saveInvoice = ActionButton(
         "Factuur opslaan (database)", method="saveInvoice"
@@ -96,3 +135,53 @@ class Parametrization(ViktorParametrization):
     invoiceStep.downLoadInvoiceWord = DownloadButton(
         "Factuur downloaden (docx)", method="downLoadInvoiceWord"
     )
+
+    statementStep = Step("Klantoverzicht", views=["viewStatement"])
+    statementStep.intro = Text(
+        "# Klantoverzicht\nStel een overzicht op van alle betalingen van een klant over een willekeurige periode, bijvoorbeeld een kwartaal of jaar. De betalingen worden per maand weergegeven met subtotalen."
+    )
+    statementStep.clientQuery = TextField(
+        "Zoek klant",
+        description="Zoek op (een deel van) de klantnaam of het klantnummer",
+    )
+    statementStep.clientName = OptionField("Klantnaam", options=getStatementClients)
+    statementStep.lb0 = LineBreak()
+    statementStep.startDate = DateField("Van")
+    statementStep.endDate = DateField("Tot en met")
+    statementStep.lb1 = LineBreak()
+    statementStep.statementDate = DateField("Datum overzicht")
+    statementStep.lineMode = OptionField(
+        "Regels",
+        LINE_MODES,
+        default=LINE_MODE_ALL,
+        description="Groepeer de regels binnen elke maand voor klanten met veel sessies",
+    )
+    statementStep.subheader0 = Text("## Downloaden\n")
+    statementStep.downloadStatementPDF = DownloadButton(
+        "Overzicht downloaden (pdf)", method="downloadStatementPDF"
+    )
+    statementStep.downloadStatementWord = DownloadButton(
+        "Overzicht downloaden (docx)", method="downloadStatementWord"
+    )
+
+    exportStep = Step("Exporteren")
+    exportStep.intro = Text(
+        "# Finance data exporteren\nExporteer de opgeslagen betalingen per klant, bijvoorbeeld voor de boekhouding. Laat klant en datums leeg om alles te exporteren."
+    )
+    exportStep.clientQuery = TextField(
+        "Zoek klant",
+        description="Zoek op (een deel van) de klantnaam of het klantnummer",
+    )
+    exportStep.clientName = OptionField(
+        "Klantnaam", options=getExportClients, description="Leeg voor alle klanten"
+    )
+    exportStep.lb0 = LineBreak()
+    exportStep.startDate = DateField("Van")
+    exportStep.endDate = DateField("Tot en met")
+    exportStep.lb1 = LineBreak()
+    exportStep.downloadFinanceDataCsv = DownloadButton(
+        "Exporteren (csv)", method="downloadFinanceDataCsv"
+    )
+    exportStep.downloadFinanceDataXlsx = DownloadButton(
+        "Exporteren (xlsx)", method="downloadFinanceDataXlsx"
+    )
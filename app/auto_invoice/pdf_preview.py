@@ -0,0 +1,221 @@
+import zlib
+
+from viktor.external.word import WordFileTag
+
+PREVIEW_MODE_FAST = "Snel voorbeeld"
+PREVIEW_MODE_OFFICIAL = "Officieel document"
+
+PREVIEW_MODES = [PREVIEW_MODE_FAST, PREVIEW_MODE_OFFICIAL]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+FONT_SIZE = 9
+LINE_HEIGHT = 14
+
+# (header, tag key, x position, right aligned, max width) of the payments table,
+# left aligned text is truncated to its max width (wide enough for date ranges)
+PAYMENT_COLUMNS = [
+    ("Datum", "date", MARGIN, False, 100),
+    ("Omschrijving", "description", MARGIN + 105, False, 180),
+    ("Aantal", "quantity", 370, True, None),
+    ("Prijs", "price", 430, True, None),
+    ("BTW %", "taxRate", 480, True, None),
+    ("Totaal", "total", PAGE_WIDTH - MARGIN, True, None),
+]
+
+# (label, tag key) of the invoice or statement details, shown if the tag is given
+DETAIL_FIELDS = [
+    ("Factuurnummer", "invoiceNumber"),
+    ("Factuurdatum", "invoiceDate"),
+    ("Datum", "statementDate"),
+    ("Periode", "invoicePeriod"),
+    ("Periode", "statementPeriod"),
+    ("Vervaldatum", "expirationDate"),
+]
+
+# Helvetica glyph widths (1/1000 em) of the printable ASCII characters (from " "
+# to "~"), other characters (mostly accented letters) count as DEFAULT_WIDTH
+HELVETICA_WIDTHS = dict(
+    zip(
+        map(chr, range(32, 127)),
+        map(
+            int,
+            """
+            278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556
+            556 556 556 556 556 556 556 278 278 584 584 584 556 1015 667 667 722 722
+            667 611 778 722 278 500 667 556 833 722 778 667 778 722 667 611 722 667 944
+            667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 556 222 222
+            500 222 833 556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334
+            584
+            """.split(),
+        ),
+    ),
+    **{"€": 556, "…": 1000},
+)
+DEFAULT_WIDTH = 556
+
+ELLIPSIS = "…"
+
+
+def textWidth(text: str, size: float) -> float:
+    return sum(HELVETICA_WIDTHS.get(c, DEFAULT_WIDTH) for c in text) * size / 1000
+
+
+def fitText(text: str, width: float, size: float = FONT_SIZE) -> str:
+    """
+    Truncate text (with an ellipsis) such that it fits in the given width
+    """
+    text = str(text)
+    if textWidth(text, size) <= width:
+        return text
+    available = width * 1000 / size - HELVETICA_WIDTHS[ELLIPSIS]
+    for i, c in enumerate(text):
+        available -= HELVETICA_WIDTHS.get(c, DEFAULT_WIDTH)
+        if available < 0:
+            return text[:i].rstrip() + ELLIPSIS
+    return text
+
+
+def escapeText(text: str) -> bytes:
+    encoded = str(text).encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class PdfPage:
+    """
+    Content stream of a single page
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def text(
+        self, x: float, y: float, text: str, bold=False, size=FONT_SIZE, right=False
+    ):
+        if right:
+            x -= textWidth(str(text), size)
+        font = b"/F2" if bold else b"/F1"
+        self.commands.append(
+            b"BT %s %g Tf %.2f %.2f Td (%s) Tj ET"
+            % (font, size, x, y, escapeText(text))
+        )
+
+    def line(self, x0: float, y0: float, x1: float, y1: float):
+        self.commands.append(b"%.2f %.2f m %.2f %.2f l S" % (x0, y0, x1, y1))
+
+
+def writePdf(pages: list[PdfPage]) -> bytes:
+    """
+    Serialize pages into a PDF document with the standard Helvetica fonts
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    pageIds = []
+    for page in pages:
+        content = zlib.compress(b"\n".join(page.commands))
+        objects.append(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+            % (len(content), content)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, len(objects))
+        )
+        pageIds.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % pageId for pageId in pageIds)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(pageIds))
+
+    pdf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(pdf)
+
+
+def renderInvoicePreviewPdf(
+    components: list[WordFileTag], title: str = "FACTUUR (voorbeeld)"
+) -> bytes:
+    """
+    Lay out the invoice fields (as gathered for the word template) directly into a
+    PDF. Meant as fast preview, the official document is still rendered from docx.
+    """
+    tags = {component.identifier: component.value for component in components}
+    address = tags["clientAddress"]
+    right = PAGE_WIDTH - MARGIN
+
+    page = PdfPage()
+    pages = [page]
+    y = PAGE_HEIGHT - MARGIN
+    page.text(MARGIN, y, "CALISTRENGTH", bold=True, size=16)
+    page.text(right, y, title, bold=True, size=12, right=True)
+
+    # client and invoice details
+    y -= 3 * LINE_HEIGHT
+    clientLines = [
+        tags["clientName"],
+        tags["clientLegalContact"],
+        address.streetAndNumber,
+        f"{address.postalCode} {address.city}",
+        tags["clientEmail"],
+    ]
+    invoiceLines = [(label, tags[key]) for label, key in DETAIL_FIELDS if key in tags]
+    for i in range(max(len(clientLines), len(invoiceLines))):
+        if i < len(clientLines):
+            page.text(MARGIN, y, clientLines[i], bold=i == 0)
+        if i < len(invoiceLines):
+            label, value = invoiceLines[i]
+            page.text(330, y, f"{label}:", bold=True)
+            page.text(right, y, value, right=True)
+        y -= LINE_HEIGHT
+
+    # payments table, continued on new pages when needed
+    def tableHeader(page: PdfPage, y: float) -> float:
+        for header, _, x, alignRight, _ in PAYMENT_COLUMNS:
+            page.text(x, y, header, bold=True, right=alignRight)
+        page.line(MARGIN, y - 4, right, y - 4)
+        return y - LINE_HEIGHT - 2
+
+    y = tableHeader(page, y - 2 * LINE_HEIGHT)
+    for payment in tags["payments"]:
+        if y < MARGIN + 5 * LINE_HEIGHT:
+            page = PdfPage()
+            pages.append(page)
+            y = tableHeader(page, PAGE_HEIGHT - MARGIN)
+        for _, key, x, alignRight, maxWidth in PAYMENT_COLUMNS:
+            value = (
+                payment[key] if maxWidth is None else fitText(payment[key], maxWidth)
+            )
+            page.text(x, y, value, right=alignRight)
+        y -= LINE_HEIGHT
+
+    # totals
+    page.line(MARGIN, y + LINE_HEIGHT - 4, right, y + LINE_HEIGHT - 4)
+    y -= 4
+    for label, key in [
+        ("Totaal excl. BTW", "totalExcl"),
+        ("BTW", "tax"),
+        ("Totaal", "total"),
+    ]:
+        page.text(430, y, label, bold=key == "total", right=True)
+        page.text(right, y, f"€ {tags[key]}", bold=key == "total", right=True)
+        y -= LINE_HEIGHT
+
+    for number, page in enumerate(pages, start=1):
+        page.text(
+            right, MARGIN / 2, f"Pagina {number} van {len(pages)}", size=7, right=True
+        )
+    return writePdf(pages)
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from hashlib import sha1
+from threading import Lock
+from typing import Callable
+
+PRERENDER_WORKERS = 2
+
+PRERENDER_MAX_JOBS = 8
+
+# invoice parameters that change the rendered document
+PRERENDER_FIELDS = [
+    "clientName",
+    "invoiceNumber",
+    "invoiceYear",
+    "invoicePeriod",
+    "invoiceIndex",
+    "invoiceDate",
+    "lineMode",
+]
+
+
+def invoiceFingerprint(invoiceParams, entityId: int, *extra) -> str:
+    """
+    Fingerprint of everything that determines the rendered invoice, including the
+    entity whose finance data it is rendered from
+    """
+    values = [str(entityId)]
+    values += [str(invoiceParams.get(field)) for field in PRERENDER_FIELDS]
+    values += [str(value) for value in extra]
+    return sha1("\x1f".join(values).encode()).hexdigest()
+
+
+class InvoicePrerenderer:
+    """
+    Bounded background queue for invoice render jobs. Each owner (entity) has at
+    most one relevant job: submitting a new fingerprint cancels or drops the older
+    jobs of that owner. When the queue is full the oldest job is dropped.
+    """
+
+    def __init__(
+        self, maxWorkers: int = PRERENDER_WORKERS, maxJobs: int = PRERENDER_MAX_JOBS
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix="invoice-prerender"
+        )
+        self._jobs = OrderedDict()  # fingerprint -> (owner, future)
+        self._maxJobs = maxJobs
+        self._lock = Lock()
+
+    def submit(self, owner, fingerprint: str, render: Callable, *args) -> Future:
+        """
+        Enqueue render(*args) under fingerprint, dropping stale jobs of owner
+        """
+        with self._lock:
+            for key, (jobOwner, future) in list(self._jobs.items()):
+                if jobOwner == owner and key != fingerprint:
+                    future.cancel()
+                    del self._jobs[key]
+            if fingerprint in self._jobs:
+                return self._jobs[fingerprint][1]
+            while len(self._jobs) >= self._maxJobs:
+                _, (_, future) = self._jobs.popitem(last=False)
+                future.cancel()
+            future = self._executor.submit(render, *args)
+            self._jobs[fingerprint] = (owner, future)
+            return future
+
+    def get(self, fingerprint: str):
+        """
+        Get result of the job with fingerprint, waiting for it if it is still running.
+        Returns None if there is no (successful) job, in which case the caller
+        should render synchronously.
+        """
+        with self._lock:
+            if (job := self._jobs.get(fingerprint)) is None:
+                return None
+        future = job[1]
+        try:
+            return future.result()
+        except CancelledError:
+            return None
+        except Exception:
+            with self._lock:
+                self._jobs.pop(fingerprint, None)
+            return None
@@ -0,0 +1,147 @@
+from datetime import date as Date
+from typing import NamedTuple
+
+import numpy as np
+
+from app.auto_invoice.finance_data import ClientRecord, FinanceData, formatOrdinal
+from app.auto_invoice.invoice_number import InvoiceNumber, naturalKey
+
+RECONCILIATION_UNBILLED = "Niet gefactureerd"
+RECONCILIATION_UNUSED = "Factuur zonder betalingen"
+RECONCILIATION_PERIOD = "Periode wijkt af"
+RECONCILIATION_CLIENT = "Ander klantnummer"
+
+RECONCILIATION_KINDS = [
+    RECONCILIATION_UNBILLED,
+    RECONCILIATION_UNUSED,
+    RECONCILIATION_PERIOD,
+    RECONCILIATION_CLIENT,
+]
+
+EPOCH_ORDINAL = Date(1970, 1, 1).toordinal()
+
+
+class ReconciliationIssue(NamedTuple):
+    kind: str
+    client: str
+    date: str  # empty for invoice numbers without payments
+    invoiceNumber: str
+
+
+class ReconciliationReport:
+    """
+    Exceptions found while reconciling payments with invoice numbers and periods
+    """
+
+    __slots__ = ["issues", "counts"]
+
+    def __init__(self):
+        self.issues = []
+        self.counts = dict.fromkeys(RECONCILIATION_KINDS, 0)
+
+    def add(self, kind: str, client: str, date: str, invoiceNumber: str) -> None:
+        self.issues.append(ReconciliationIssue(kind, client, date, invoiceNumber))
+        self.counts[kind] += 1
+
+    def byKind(self, kind: str) -> list[ReconciliationIssue]:
+        return [issue for issue in self.issues if issue.kind == kind]
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{count}x {kind.lower()}" for kind, count in self.counts.items() if count
+        )
+
+    def __len__(self) -> int:
+        return len(self.issues)
+
+
+def getPaymentMonths(ordinals: np.ndarray) -> np.ndarray:
+    """
+    Period (months since January 1970) of each payment ordinal
+    """
+    days = (ordinals.astype(np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+    return days.astype("datetime64[M]").astype(np.int64)
+
+
+def getInvoiceMonth(invoiceNumber: InvoiceNumber) -> int:
+    """
+    Period (months since January 1970) an invoice number belongs to
+    """
+    return (invoiceNumber.year - 1970) * 12 + invoiceNumber.periodNr - 1
+
+
+def reconcileClient(
+    record: ClientRecord, clientNumber: str, report: ReconciliationReport
+) -> None:
+    """
+    Reconcile the payments of a single client. Payment rows are joined on their
+    invoice number with a hash table of the distinct invoice numbers, such that each
+    number is parsed and looked up once and rows are compared as numpy columns.
+    """
+    payments = record.payments
+    available = set(record.availableInvoiceNumbers)
+
+    # factorize invoice number column: row -> id of distinct invoice number
+    numberIds = {}
+    ids = np.fromiter(
+        (numberIds.setdefault(text, len(numberIds)) for text in payments.invoiceNumber),
+        np.int32,
+        len(payments),
+    )
+    texts = list(numberIds)
+    parsed = [InvoiceNumber.parse(text) for text in texts]
+    billed = np.array(
+        [
+            number is not None and text in available
+            for text, number in zip(texts, parsed)
+        ],
+        dtype=bool,
+    )
+    months = np.array(
+        [-1 if number is None else getInvoiceMonth(number) for number in parsed],
+        dtype=np.int64,
+    )
+    clientKey = None if clientNumber is None else naturalKey(str(clientNumber))
+    otherClient = np.array(
+        [
+            number is not None
+            and clientKey is not None
+            and naturalKey(number.clientNr) != clientKey
+            for number in parsed
+        ],
+        dtype=bool,
+    )
+
+    unbilled = ~billed[ids]
+    wrongPeriod = ~unbilled & (months[ids] != getPaymentMonths(payments.ordinal))
+    wrongClient = ~unbilled & otherClient[ids]
+    for kind, mask in [
+        (RECONCILIATION_UNBILLED, unbilled),
+        (RECONCILIATION_PERIOD, wrongPeriod),
+        (RECONCILIATION_CLIENT, wrongClient),
+    ]:
+        for row in np.flatnonzero(mask).tolist():
+            report.add(
+                kind,
+                record.name,
+                formatOrdinal(payments.ordinal[row]),
+                payments.invoiceNumber[row],
+            )
+
+    # invoice numbers without any payment
+    for text in record.availableInvoiceNumbers:
+        if text not in numberIds and InvoiceNumber.parse(text) is not None:
+            report.add(RECONCILIATION_UNUSED, record.name, "", text)
+
+
+def reconcileFinanceData(financeData: FinanceData) -> ReconciliationReport:
+    """
+    Find payments that were never billed, invoice numbers without payments and
+    payments whose invoice number does not match their period or client. Runs in
+    linear time over the payment rows.
+    """
+    report = ReconciliationReport()
+    clientNumbers = dict(zip(financeData.availableClients, financeData.clientNumbers))
+    for name, record in financeData.clients.items():
+        reconcileClient(record, clientNumbers.get(name), report)
+    return report
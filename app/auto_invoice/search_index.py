@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+from app.auto_invoice.finance_data import FinanceData
+
+SEARCH_LIMIT = 25
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalizeSearchText(text: str) -> list[str]:
+    """
+    Normalize text into lowercase, accent free alphanumeric words
+    """
+    text = str(text).lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return NON_ALPHANUMERIC.sub(" ", text).split()
+
+
+def getTrigrams(term: str) -> set[str]:
+    padded = f" {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Prefix + trigram index over a set of values. Every value is indexed under its
+    words and under its compacted (space free) text, so "jan de" and "vries" both
+    find "Jan de Vries".
+    """
+
+    __slots__ = ("values", "_terms", "_termIds", "_termLengths", "_trigrams")
+
+    def __init__(self):
+        self.values = []
+        self._terms = []  # (term, valueId) while adding, sorted terms once frozen
+        self._termIds = None  # valueId per sorted term
+        self._termLengths = None
+        self._trigrams = defaultdict(list)  # trigram -> valueIds
+
+    def add(self, value: str, *texts) -> None:
+        valueId = len(self.values)
+        self.values.append(value)
+        terms = set()
+        for text in texts:
+            words = normalizeSearchText(text)
+            terms.update(words)
+            terms.add("".join(words))
+        terms.discard("")
+        trigrams = set()
+        for term in terms:
+            self._terms.append((term, valueId))
+            trigrams |= getTrigrams(term)
+        for trigram in trigrams:
+            self._trigrams[trigram].append(valueId)
+
+    def freeze(self):
+        self._terms.sort()
+        self._termIds = np.array([valueId for _, valueId in self._terms], np.int32)
+        self._termLengths = np.array([len(term) for term, _ in self._terms], np.int32)
+        self._terms = [term for term, _ in self._terms]
+        self._trigrams = {
+            trigram: np.array(valueIds, dtype=np.int32)
+            for trigram, valueIds in self._trigrams.items()
+        }
+        return self
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list[str]:
+        """
+        Return the best matching values, ranked by exact match, prefix match and
+        trigram similarity
+        """
+        query = "".join(normalizeSearchText(query))
+        if not query or not self.values:
+            return []
+        scores = np.zeros(len(self.values))
+
+        # prefix matches: a contiguous slice of the sorted terms
+        i = bisect_left(self._terms, query)
+        j = bisect_left(self._terms, query + "\uffff", lo=i)
+        lengths = self._termLengths[i:j]
+        prefixScores = np.where(
+            lengths == len(query), 100.0, 50 + 10 * len(query) / lengths
+        )
+        np.maximum.at(scores, self._termIds[i:j], prefixScores)
+
+        # trigram similarity, also matches typos and infixes. Trigram matches always
+        # rank below prefix matches, so they are only needed if there are too few.
+        queryTrigrams = getTrigrams(query)
+        postings = [self._trigrams[t] for t in queryTrigrams if t in self._trigrams]
+        if j - i < limit and postings:
+            counts = np.bincount(np.concatenate(postings), minlength=len(self.values))
+            similarity = counts / len(queryTrigrams)
+            trigramScores = np.where(similarity >= 0.5, 40 * similarity, 0.0)
+            np.maximum(scores, trigramScores, out=scores)
+
+        matches = np.flatnonzero(scores)
+        ranked = matches[np.argsort(-scores[matches], kind="stable")][:limit]
+        return [self.values[valueId] for valueId in ranked.tolist()]
+
+
+class FinanceSearchIndex:
+    """
+    Search index over client names and numbers, and over the invoice numbers of
+    each client
+    """
+
+    __slots__ = ("clients", "invoiceNumbers", "_financeData")
+
+    def __init__(self, financeData: FinanceData):
+        self.clients = SearchIndex()
+        self.invoiceNumbers = {}  # client -> SearchIndex, built on first search
+        self._financeData = financeData
+
+    @classmethod
+    def fromFinanceData(cls, financeData: FinanceData):
+        index = cls(financeData)
+        for client, number in zip(
+            financeData.availableClients, financeData.clientNumbers
+        ):
+            index.clients.add(client, client, number)
+        index.clients.freeze()
+        return index
+
+    def searchClients(self, query: str, limit: int = SEARCH_LIMIT) -> list[str]:
+        return self.clients.search(query, limit)
+
+    def searchInvoiceNumbers(
+        self, client: str, query: str, limit: int = SEARCH_LIMIT
+    ) -> list[str]:
+        if (invoiceIndex := self.invoiceNumbers.get(client)) is None:
+            if (record := self._financeData.client(client)) is None:
+                return []
+            invoiceIndex = SearchIndex()
+            for invoiceNumber in record.availableInvoiceNumbers:
+                invoiceIndex.add(invoiceNumber, invoiceNumber)
+            invoiceIndex = self.invoiceNumbers.setdefault(client, invoiceIndex.freeze())
+        return invoiceIndex.search(query, limit)
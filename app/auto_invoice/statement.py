@@ -0,0 +1,57 @@
+from datetime import date as Date
+from itertools import groupby
+from typing import Iterable
+
+from app.auto_invoice.invoice_lines import (
+    LINE_MODE_ALL,
+    InvoiceLine,
+    formatInvoiceRow,
+    summarizeInvoiceLines,
+)
+
+MONTH_NAMES_NL = [
+    "januari",
+    "februari",
+    "maart",
+    "april",
+    "mei",
+    "juni",
+    "juli",
+    "augustus",
+    "september",
+    "oktober",
+    "november",
+    "december",
+]
+
+
+def getLineMonth(line: InvoiceLine) -> tuple[int, int]:
+    date = Date.fromordinal(line.ordinal)
+    return date.year, date.month
+
+
+def summarizeStatementLines(
+    lines: Iterable[InvoiceLine], mode: str = LINE_MODE_ALL
+) -> tuple[list[dict], dict]:
+    """
+    Consume date sorted invoice lines of an arbitrary date range in a single pass.
+    Lines are summarized per month (in the given line mode), each month is closed by
+    a subtotal row. Returns the rows of the payments table and the statement totals.
+    """
+    totals = {"quantity": 0.0, "totalExcl": 0.0, "tax": 0.0, "total": 0.0}
+    rows = []
+    for (year, month), monthLines in groupby(lines, key=getLineMonth):
+        monthRows, monthTotals = summarizeInvoiceLines(monthLines, mode)
+        rows.extend(monthRows)
+        rows.append(
+            formatInvoiceRow(
+                "",
+                monthTotals["quantity"],
+                monthTotals["totalExcl"],
+                monthTotals["total"],
+                f"Subtotaal {MONTH_NAMES_NL[month - 1]} {year}",
+            )
+        )
+        for key, value in monthTotals.items():
+            totals[key] += value
+    return rows, totals
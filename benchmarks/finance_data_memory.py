@@ -0,0 +1,70 @@
+"""
+Compare the memory footprint of finance data parsed from the stored JSON layout
+(nested dicts of strings) with the typed, columnar FinanceData model. Run from the
+repository root:
+
+    python -m benchmarks.finance_data_memory
+"""
+
+import gc
+import json
+import tracemalloc
+
+from tabulate import tabulate
+
+from app.auto_invoice.finance_data import FinanceData
+from benchmarks.render_invoice import generateClientData
+
+CLIENT_COUNTS = [10, 100, 500]
+
+PAYMENTS_PER_CLIENT = 250
+
+
+def generateFinanceDocument(clientCount: int) -> str:
+    """
+    Generate a synthetic stored finance data document
+    """
+    financeData = {}
+    for i in range(clientCount):
+        clientData = generateClientData(PAYMENTS_PER_CLIENT)
+        clientData["availableInvoiceNumbers"] = [
+            f"{i}.1.{m:02d}.24" for m in range(1, 13)
+        ]
+        clientData["email"] = f"client{i}@example.com"
+        financeData[f"Client {i}"] = clientData
+    financeData["availableClients"] = list(financeData)
+    financeData["clientNumbers"] = [str(i) for i in range(clientCount)]
+    return json.dumps(financeData)
+
+
+def measure(load, document: str) -> int:
+    gc.collect()
+    tracemalloc.start()
+    data = load(document)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current
+
+
+def main() -> None:
+    table = []
+    for clientCount in CLIENT_COUNTS:
+        document = generateFinanceDocument(clientCount)
+        nested = measure(json.loads, document)
+        typed = measure(lambda doc: FinanceData.fromJson(json.loads(doc)), document)
+        table.append(
+            [
+                clientCount,
+                clientCount * PAYMENTS_PER_CLIENT,
+                nested // 1024,
+                typed // 1024,
+                f"{nested / typed:.1f}x",
+            ]
+        )
+    headers = ["clients", "payments", "nested (KiB)", "FinanceData (KiB)", "saving"]
+    print(tabulate(table, headers=headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark invoice table generation (and optionally rendering) against the number of
+invoice lines for every invoice line mode. Run from the repository root:
+
+    python -m benchmarks.render_invoice [--render]
+
+`--render` also renders the word template, which requires a VIKTOR worker context.
+"""
+
+import tracemalloc
+from datetime import date as Date
+from datetime import timedelta
+from sys import argv
+from time import perf_counter
+
+from tabulate import tabulate
+
+from app.auto_invoice.finance_data import ClientRecord
+from app.auto_invoice.invoice_lines import (
+    LINE_MODES,
+    iterInvoiceLines,
+    summarizeInvoiceLines,
+)
+
+LINE_COUNTS = [10, 100, 1_000, 5_000, 20_000]
+
+DESCRIPTIONS = ["Personal training", "Groepsles", "Online coaching", "Intake"]
+
+
+def generateClientData(lineCount: int) -> dict:
+    """
+    Generate synthetic client data with one payment per day
+    """
+    clientData = {"availableInvoiceNumbers": []}
+    first = Date(2000, 1, 1)
+    for i in range(lineCount):
+        date = (first + timedelta(days=i)).strftime(r"%d/%m/%Y")
+        clientData[date] = {
+            "priceIncl": "60.5",
+            "priceExcl": "50.0",
+            "invoiceNumber": "1.1.01.24",
+            "quantity": "1.0",
+            "description": DESCRIPTIONS[i % len(DESCRIPTIONS)],
+        }
+    return clientData
+
+
+def renderPayments(rows: list[dict], totals: dict) -> None:
+    from viktor.external.word import WordFileTag, render_word_file
+
+    from app.helper import pyutils
+
+    components = [WordFileTag("payments", rows)]
+    components += [WordFileTag(key, f"{value:.2f}") for key, value in totals.items()]
+    template_dir = pyutils.get_root() / "app" / "lib" / "invoice_template.docx"
+    with open(template_dir, "rb") as template:
+        render_word_file(template, components)
+
+
+def main(render: bool = False) -> None:
+    table = []
+    for lineCount in LINE_COUNTS:
+        clientData = ClientRecord.fromJson("client", generateClientData(lineCount))
+        start = Date(2000, 1, 1).toordinal()
+        end = start + lineCount
+        for mode in LINE_MODES:
+            tracemalloc.start()
+            t0 = perf_counter()
+            rows, totals = summarizeInvoiceLines(
+                iterInvoiceLines(clientData.payments.between(start, end)), mode
+            )
+            t1 = perf_counter()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            row = [lineCount, mode, len(rows), f"{(t1 - t0) * 1e3:.2f}", peak // 1024]
+            if render:
+                t0 = perf_counter()
+                renderPayments(rows, totals)
+                row.append(f"{(perf_counter() - t0) * 1e3:.0f}")
+            table.append(row)
+    headers = ["lines", "mode", "table rows", "build (ms)", "peak (KiB)"]
+    if render:
+        headers.append("render (ms)")
+    print(tabulate(table, headers=headers))
+
+
+if __name__ == "__main__":
+    main(render="--render" in argv)
@@ -0,0 +1,58 @@
+import copy
+
+from app.auto_invoice.finance_data import FinanceData, isCanonicalFinanceFloat
+
+
+def storedFinanceData() -> dict:
+    """
+    Document in the stored JSON layout, including numbers written by older
+    versions ("5", "1") that do not round trip through float
+    """
+    return {
+        "Client A": {
+            "availableInvoiceNumbers": ["1.1.01.24", "1.2.01.24"],
+            "02/01/2024": {
+                "priceIncl": "60.5",
+                "priceExcl": "50.0",
+                "invoiceNumber": "1.1.01.24",
+                "quantity": "1.0",
+                "description": "Personal training",
+            },
+            "01/01/2024": {
+                "priceIncl": "5",
+                "priceExcl": "NA",
+                "invoiceNumber": "1.2.01.24",
+                "quantity": "1",
+                "description": "Groepsles",
+            },
+            "03/01/2024": {
+                "priceIncl": "6.05",
+                "priceExcl": "5.00",
+                "invoiceNumber": "NA",
+                "description": "Intake",
+            },
+            "legalContact": "J. Jansen",
+            "email": "a@example.com",
+            "note": "unknown keys are kept",
+        },
+        "Client B": {"availableInvoiceNumbers": [], "city": "Delft"},
+        "availableClients": ["Client A", "Client B"],
+        "clientNumbers": ["1", "2"],
+    }
+
+
+def test_json_round_trip_keeps_stored_layout():
+    stored = storedFinanceData()
+    financeData = FinanceData.fromJson(copy.deepcopy(stored))
+    assert financeData.toJson() == stored
+    payments = financeData.client("Client A").payments
+    assert payments.priceIncl.tolist()[0] == 5.0  # sorted by date
+
+
+def test_canonical_finance_float():
+    assert isCanonicalFinanceFloat("5.0")
+    assert isCanonicalFinanceFloat("NA")
+    assert not isCanonicalFinanceFloat("5")
+    assert not isCanonicalFinanceFloat("5.00")
+    assert not isCanonicalFinanceFloat("nan")
+    assert not isCanonicalFinanceFloat(None)
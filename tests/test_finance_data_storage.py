@@ -0,0 +1,263 @@
+import json
+from threading import Event, Thread
+from time import sleep
+
+import pytest
+from viktor.core import File
+from viktor.errors import UserError
+
+from app.auto_invoice import definitions
+from app.auto_invoice.definitions import (
+    FINANCE_DATA_KEY,
+    applyFinanceDataDelta,
+    combineFinanceDataDeltas,
+    compactFinanceSegments,
+    getFinanceDataFromStorage,
+    getFinanceSegmentFromStorage,
+    getFinanceSegmentKey,
+    saveFinanceSegmentToStorage,
+    updateFinanceDataInStorage,
+)
+
+PAYMENT_A = {"priceIncl": "60.5", "priceExcl": "50.0", "invoiceNumber": "1.1.01.99"}
+PAYMENT_B = {"priceIncl": "30.25", "priceExcl": "25.0", "invoiceNumber": "2.1.01.99"}
+
+DELTA_A = {"A": {"02/01/2099": PAYMENT_A}}
+DELTA_B = {"B": {"02/01/2099": PAYMENT_B}}
+DELTA_C = {"A": {"03/01/2099": PAYMENT_B}}
+
+
+class FakeStorage:
+    """
+    In-memory stand-in for the entity storage of a single entity
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.onSet = None  # hook called after each set
+
+    def __call__(self):
+        return self
+
+    def list(self, scope):
+        return dict(self.files)
+
+    def get(self, key, scope):
+        return self.files[key]
+
+    def set(self, key, data, scope):
+        self.files[key] = File.from_data(data.getvalue_binary())
+        if self.onSet is not None:
+            self.onSet(key)
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = FakeStorage()
+    monkeypatch.setattr(definitions, "Storage", storage)
+    return storage
+
+
+def storedFinanceData() -> dict:
+    return {
+        "A": {"01/01/2099": PAYMENT_A},
+        "B": {"01/01/2099": PAYMENT_B},
+        "availableClients": ["A", "B"],
+        "clientNumbers": ["1", "2"],
+    }
+
+
+def test_combined_deltas_keep_clients_of_earlier_deltas():
+    d1 = {
+        "B": {"02/01/2099": PAYMENT_B},
+        "availableClients": ["A", "B"],
+        "clientNumbers": ["1", "2"],
+    }
+    d2 = {
+        "A": {"02/01/2099": PAYMENT_A},
+        "availableClients": ["A"],
+        "clientNumbers": ["1"],
+    }
+    combined = combineFinanceDataDeltas([d1, d2])
+    assert combined["availableClients"] == ["A", "B"]
+    assert combined["clientNumbers"] == ["1", "2"]
+
+    financeData = applyFinanceDataDelta(storedFinanceData(), combined)
+    assert financeData["A"]["02/01/2099"] == PAYMENT_A
+    assert financeData["B"]["02/01/2099"] == PAYMENT_B
+    assert financeData["B"]["01/01/2099"] == PAYMENT_B
+
+
+def test_update_embeds_revision(storage):
+    updateFinanceDataInStorage(1, storedFinanceData())
+    document = json.loads(storage.files[FINANCE_DATA_KEY].getvalue())
+    assert document["revision"] == definitions.getFinanceDataRevision()
+    assert getFinanceDataFromStorage() == storedFinanceData()
+
+
+def test_overwritten_update_is_retried(storage):
+    updateFinanceDataInStorage(1, storedFinanceData())
+    concurrent = {**storedFinanceData(), "C": {"01/01/2099": PAYMENT_A}}
+    concurrent["availableClients"] = ["A", "B", "C"]
+    concurrent["clientNumbers"] = ["1", "2", "3"]
+
+    def overwrite(key):
+        # another writer that read the same revision stores its document last
+        if key == FINANCE_DATA_KEY and storage.onSet is not None:
+            storage.onSet = None
+            document = {**concurrent, "revision": "concurrent"}
+            storage.set(FINANCE_DATA_KEY, File.from_data(json.dumps(document)), None)
+
+    storage.onSet = overwrite
+    attempts = updateFinanceDataInStorage(1, {"A": {"02/01/2099": PAYMENT_A}})
+    assert attempts == 2
+    financeData = getFinanceDataFromStorage()
+    assert financeData["A"]["02/01/2099"] == PAYMENT_A
+    assert financeData["C"] == {"01/01/2099": PAYMENT_A}
+
+
+def test_concurrent_segment_write_is_merged(storage):
+    saveFinanceSegmentToStorage(2020, {"A": {"01/01/2020": PAYMENT_A}}, "1-a")
+
+    def overwrite(key):
+        # another writer that read the same segment revision stores it first
+        if key == getFinanceSegmentKey(2020) and storage.onSet is not None:
+            storage.onSet = None
+            segment = {
+                "A": {"01/01/2020": PAYMENT_A},
+                "B": {"01/01/2020": PAYMENT_B},
+            }
+            saveFinanceSegmentToStorage(2020, segment, "2-concurrent")
+
+    storage.onSet = overwrite
+    compactFinanceSegments({2020: {"A": {"02/01/2020": PAYMENT_A}}})
+    segment = getFinanceSegmentFromStorage(2020)
+    assert segment["A"] == {"01/01/2020": PAYMENT_A, "02/01/2020": PAYMENT_A}
+    assert segment["B"] == {"01/01/2020": PAYMENT_B}
+
+
+def test_finance_data_is_cached_per_entity(monkeypatch):
+    definitions._loadFinanceData.cache_clear()
+    storages = {1: FakeStorage(), 2: FakeStorage()}
+    for entityId, client in [(1, "A"), (2, "B")]:
+        document = {client: {}, "availableClients": [client], "clientNumbers": ["1"]}
+        storages[entityId].files[FINANCE_DATA_KEY] = File.from_data(
+            json.dumps(document)
+        )
+    for entityId, client in [(1, "A"), (2, "B")]:
+        monkeypatch.setattr(definitions, "Storage", storages[entityId])
+        financeData = definitions.loadFinanceData(entityId)
+        assert financeData.availableClients == [client]
+
+
+def test_search_index_is_cached_per_entity(monkeypatch):
+    definitions._loadFinanceData.cache_clear()
+    definitions._loadSearchIndex.cache_clear()
+    for entityId, client in [(1, "Alfa"), (2, "Bravo")]:
+        storage = FakeStorage()
+        document = {client: {}, "availableClients": [client], "clientNumbers": ["1"]}
+        storage.files[FINANCE_DATA_KEY] = File.from_data(json.dumps(document))
+        monkeypatch.setattr(definitions, "Storage", storage)
+        assert definitions.loadSearchIndex(entityId).searchClients(client) == [client]
+
+
+def runInThread(results: dict, name: str, function, *args) -> Thread:
+    def run():
+        try:
+            results[name] = function(*args)
+        except Exception as error:
+            results[name] = error
+
+    thread = Thread(target=run)
+    thread.start()
+    return thread
+
+
+def waitForPendingDeltas(entityId: int, count: int) -> None:
+    for _ in range(500):
+        batch = definitions._pendingFinanceDataWrites.get(entityId)
+        if batch is not None and len(batch[0]) == count:
+            return
+        sleep(0.01)
+    raise TimeoutError("deltas were not submitted")
+
+
+def test_updates_during_write_are_written_together(storage):
+    updateFinanceDataInStorage(1, storedFinanceData())
+    writes = []
+    writing, release = Event(), Event()
+
+    def block(key):
+        if key == FINANCE_DATA_KEY:
+            writes.append(key)
+            if not writing.is_set():
+                writing.set()
+                release.wait(5)
+
+    storage.onSet = block
+    results = {}
+    threads = [runInThread(results, "A", updateFinanceDataInStorage, 1, DELTA_A)]
+    writing.wait(5)
+    threads.append(runInThread(results, "B", updateFinanceDataInStorage, 1, DELTA_B))
+    threads.append(runInThread(results, "C", updateFinanceDataInStorage, 1, DELTA_C))
+    waitForPendingDeltas(1, 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(writes) == 2  # A, then B and C together
+    assert results["A"] == 1
+    assert sorted([results["B"], results["C"]]) == [0, 1]
+    financeData = getFinanceDataFromStorage()
+    assert financeData["A"]["02/01/2099"] == PAYMENT_A
+    assert financeData["B"]["02/01/2099"] == PAYMENT_B
+    assert financeData["A"]["03/01/2099"] == PAYMENT_B
+
+
+def test_coalesced_update_raises_error_of_write(storage, monkeypatch):
+    writing, release = Event(), Event()
+
+    def failingWrite(delta):
+        if not writing.is_set():
+            writing.set()
+            release.wait(5)
+            return 1
+        raise UserError("Could not update finance data, please try again")
+
+    monkeypatch.setattr(definitions, "writeFinanceDataDelta", failingWrite)
+    results = {}
+    threads = [runInThread(results, "A", updateFinanceDataInStorage, 1, DELTA_A)]
+    writing.wait(5)
+    threads.append(runInThread(results, "B", updateFinanceDataInStorage, 1, DELTA_B))
+    threads.append(runInThread(results, "C", updateFinanceDataInStorage, 1, DELTA_C))
+    waitForPendingDeltas(1, 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results["A"] == 1
+    assert isinstance(results["B"], UserError)
+    assert isinstance(results["C"], UserError)
+
+
+def test_data_is_not_cached_before_document_of_revision_is_written(
+    storage, monkeypatch
+):
+    definitions._loadFinanceData.cache_clear()
+    monkeypatch.setattr(definitions, "sleep", lambda seconds: None)
+    updateFinanceDataInStorage(1, storedFinanceData())
+    revision = definitions.getFinanceDataRevision()
+
+    # a writer claimed the next revision but did not store its document yet
+    nextRevision = definitions.getNextRevision(revision)
+    storage.set(
+        definitions.FINANCE_DATA_VERSION_KEY, File.from_data(nextRevision), None
+    )
+    assert definitions.loadFinanceData(1).availableClients == ["A", "B"]
+    assert definitions._loadFinanceData.cache_info().currsize == 0
+
+    document = {**storedFinanceData(), "C": {}, "revision": nextRevision}
+    document["availableClients"] = ["A", "B", "C"]
+    storage.set(FINANCE_DATA_KEY, File.from_data(json.dumps(document)), None)
+    assert definitions.loadFinanceData(1).availableClients == ["A", "B", "C"]
+    assert definitions._loadFinanceData.cache_info().currsize == 1
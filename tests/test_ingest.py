@@ -0,0 +1,102 @@
+import io
+import zipfile
+
+from viktor.core import File
+
+from app.auto_invoice.ingest import hashWorkbookValues, mergeFinanceData
+
+WORKBOOK = (
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheets><sheet name="data" sheetId="1"/></sheets></workbook>'
+)
+
+
+def makeWorkbook(cells: str, sharedStrings: list[str]) -> File:
+    items = "".join(f"<si><t>{text}</t></si>" for text in sharedStrings)
+    stream = io.BytesIO()
+    with zipfile.ZipFile(stream, "w") as archive:
+        archive.writestr("xl/workbook.xml", WORKBOOK)
+        archive.writestr(
+            "xl/sharedStrings.xml",
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f"{items}</sst>",
+        )
+        archive.writestr(
+            "xl/worksheets/sheet1.xml",
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f"<sheetData><row>{cells}</row></sheetData></worksheet>",
+        )
+    return File.from_data(stream.getvalue())
+
+
+def test_workbook_hash_ignores_styles_and_string_order():
+    original = makeWorkbook(
+        '<c r="A1" t="s"><v>0</v></c><c r="B1"><f>1+1</f><v>2</v></c>', ["A", "B"]
+    )
+    restyled = makeWorkbook(
+        '<c r="A1" s="3" t="s"><v>1</v></c><c r="B1" s="1"><f>1+1</f><v>2</v></c>',
+        ["B", "A"],
+    )
+    changed = makeWorkbook(
+        '<c r="A1" t="s"><v>1</v></c><c r="B1"><f>1+1</f><v>2</v></c>', ["A", "B"]
+    )
+    assert hashWorkbookValues([original]) == hashWorkbookValues([restyled])
+    assert hashWorkbookValues([original]) != hashWorkbookValues([changed])
+
+
+PAYMENT = {"priceIncl": "60.5", "priceExcl": "50.0", "invoiceNumber": "1.1.01.24"}
+
+
+def makeFinanceData(clients: dict, numbers: list[str]) -> dict:
+    return {**clients, "availableClients": list(clients), "clientNumbers": numbers}
+
+
+def test_merge_counts_identical_rows_as_duplicates():
+    first = makeFinanceData({"A": {"01/01/2024": PAYMENT}}, ["1"])
+    second = makeFinanceData({"A": {"01/01/2024": dict(PAYMENT)}}, ["1"])
+    merged, report = mergeFinanceData([first, second], ["a.xlsx", "b.xlsx"])
+    assert report.duplicates == 1
+    assert report.conflicts == []
+    assert merged["A"]["01/01/2024"] == PAYMENT
+
+
+def test_merge_reports_conflicting_rows_and_last_file_wins():
+    changed = {**PAYMENT, "priceIncl": "70.0"}
+    first = makeFinanceData({"A": {"01/01/2024": PAYMENT}}, ["1"])
+    second = makeFinanceData({"A": {"01/01/2024": changed}}, ["1"])
+    merged, report = mergeFinanceData([first, second], ["a.xlsx", "b.xlsx"])
+    assert report.duplicates == 0
+    assert report.conflicts == [("A", "01/01/2024", ["a.xlsx", "b.xlsx"])]
+    assert merged["A"]["01/01/2024"] == changed
+
+
+def test_merge_combines_client_attributes_and_invoice_numbers():
+    first = makeFinanceData(
+        {
+            "A": {
+                "01/01/2024": PAYMENT,
+                "email": "old@example.com",
+                "availableInvoiceNumbers": ["1.1.01.24"],
+            },
+            "B": {"city": "Delft"},
+        },
+        ["1", "2"],
+    )
+    second = makeFinanceData(
+        {
+            "A": {
+                "01/02/2024": {**PAYMENT, "invoiceNumber": "1.1.02.24"},
+                "email": "new@example.com",
+                "availableInvoiceNumbers": ["1.1.02.24"],
+            },
+            "C": {},
+        },
+        ["10", "3"],
+    )
+    merged, _ = mergeFinanceData([first, second], ["a.xlsx", "b.xlsx"])
+    assert merged["availableClients"] == ["A", "B", "C"]
+    assert merged["clientNumbers"] == ["10", "2", "3"]
+    assert merged["A"]["email"] == "new@example.com"
+    assert merged["A"]["availableInvoiceNumbers"] == ["1.1.01.24", "1.1.02.24"]
+    assert set(merged["A"]) >= {"01/01/2024", "01/02/2024"}
+    assert merged["B"]["city"] == "Delft"
@@ -0,0 +1,71 @@
+import pytest
+from viktor.errors import UserError
+
+from app.auto_invoice.finance_data import Payments, parseDate
+from app.auto_invoice.invoice_lines import (
+    formatInvoiceRow,
+    iterInvoiceLines,
+    summarizeInvoiceLines,
+)
+from app.auto_invoice.statement import summarizeStatementLines
+
+
+def makePayments(*payments: tuple[str, str, str, str]) -> Payments:
+    rows = [
+        (
+            parseDate(date),
+            {
+                "quantity": quantity,
+                "priceExcl": priceExcl,
+                "priceIncl": priceIncl,
+                "invoiceNumber": "1.1.01.99",
+                "description": "Les",
+            },
+        )
+        for date, quantity, priceExcl, priceIncl in payments
+    ]
+    return Payments.fromRows(rows)
+
+
+def test_missing_price_is_rejected_with_date():
+    payments = makePayments(
+        ("01/01/2099", "1.0", "50.0", "60.5"),
+        ("02/01/2099", "1.0", "NA", "NA"),
+    )
+    with pytest.raises(UserError, match="02/01/2099"):
+        list(iterInvoiceLines(payments))
+
+
+def test_zero_priced_lines_are_formatted():
+    payments = makePayments(
+        ("01/01/2099", "1.0", "0.0", "0.0"),
+        ("02/01/2099", "0.0", "0.0", "0.0"),
+    )
+    rows, totals = summarizeInvoiceLines(iterInvoiceLines(payments))
+    assert [row["price"] for row in rows] == ["0.00", "0.00"]
+    assert [row["taxRate"] for row in rows] == ["0", "0"]
+    assert totals["total"] == 0.0
+
+
+def test_invoice_row_tax_rate():
+    row = formatInvoiceRow("01/01/2099", 2.0, 100.0, 121.0, "Les")
+    assert row["price"] == "50.00"
+    assert row["taxRate"] == "21"
+
+
+def test_statement_subtotal_of_zero_priced_month():
+    payments = makePayments(
+        ("01/01/2099", "1.0", "0.0", "0.0"),
+        ("02/01/2099", "2.0", "0.0", "0.0"),
+        ("01/02/2099", "1.0", "50.0", "60.5"),
+    )
+    rows, totals = summarizeStatementLines(iterInvoiceLines(payments))
+    january, february = rows[2], rows[4]
+    assert january["description"] == "Subtotaal januari 2099"
+    assert (january["quantity"], january["price"], january["taxRate"]) == (
+        "3.0",
+        "0.00",
+        "0",
+    )
+    assert (february["quantity"], february["total"]) == ("1.0", "50.00")
+    assert totals["quantity"] == 4.0
@@ -0,0 +1,29 @@
+import pytest
+
+from app.auto_invoice.invoice_number import InvoiceNumber, sortInvoiceNumbers
+
+
+@pytest.mark.parametrize(
+    "text", ["NA", "1.1.-3.24", "1.1. 3.24", "1.1.0.24", "1.1.13.24", "1.1.03"]
+)
+def test_parse_rejects_malformed_numbers(text):
+    assert InvoiceNumber.parse(text) is None
+
+
+def test_parse_valid_number():
+    invoiceNumber = InvoiceNumber.parse("12.1.03.24")
+    assert (invoiceNumber.clientNr, invoiceNumber.index) == ("12", "1")
+    assert (invoiceNumber.periodNr, invoiceNumber.year) == (3, 2024)
+    assert InvoiceNumber.parse("12.1.03.24") is invoiceNumber
+
+
+def test_equality_follows_text():
+    assert InvoiceNumber.parse("12.1.03.24") != InvoiceNumber.parse("12.01.3.24")
+    assert (
+        len({InvoiceNumber.parse("12.1.03.24"), InvoiceNumber.parse("12.01.3.24")}) == 2
+    )
+
+
+def test_sort_invoice_numbers():
+    numbers = ["2.1.01.25", "NA", "10.1.12.24", "2.1.12.24"]
+    assert sortInvoiceNumbers(numbers) == ["2.1.12.24", "10.1.12.24", "2.1.01.25", "NA"]
@@ -0,0 +1,73 @@
+import re
+import zlib
+
+from munch import Munch
+from viktor.external.word import WordFileTag
+
+from app.auto_invoice.pdf_preview import (
+    FONT_SIZE,
+    fitText,
+    renderInvoicePreviewPdf,
+    textWidth,
+)
+
+LONG_DESCRIPTION = "Personal training en voedingsadvies " * 4
+
+
+def makeComponents(paymentCount: int) -> list[WordFileTag]:
+    payment = {
+        "date": "01/01/2024 - 07/01/2024",
+        "description": LONG_DESCRIPTION,
+        "quantity": "1.0",
+        "price": "50.00",
+        "total": "50.00",
+        "taxRate": "21",
+    }
+    address = Munch(streetAndNumber="Straat 1", postalCode="1234 AB", city="Delft")
+    tags = {
+        "clientName": "Client A",
+        "clientLegalContact": "J. Jansen",
+        "clientAddress": address,
+        "clientEmail": "a@example.com",
+        "invoiceNumber": "1.1.01.24",
+        "invoiceDate": "31/01/2024",
+        "invoicePeriod": "1 januari - 31 januari",
+        "expirationDate": "01/03/2024",
+        "payments": [payment] * paymentCount,
+        "totalExcl": "50.00",
+        "tax": "10.50",
+        "total": "60.50",
+    }
+    return [WordFileTag(key, value) for key, value in tags.items()]
+
+
+def test_preview_pdf_structure():
+    pdf = renderInvoicePreviewPdf(makeComponents(120))
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+
+    # xref offsets point at their objects, startxref points at the xref table
+    startxref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    assert pdf[startxref:].startswith(b"xref\n")
+    offsets = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset) :].startswith(b"%d 0 obj\n" % number)
+
+    pageCount = int(
+        re.search(rb"/Type /Pages /Kids \[[^\]]*\] /Count (\d+)", pdf).group(1)
+    )
+    assert pageCount == len(re.findall(rb"/Type /Page ", pdf)) > 1
+
+    streams = re.findall(rb"stream\n(.*?)\nendstream", pdf, re.DOTALL)
+    content = b"".join(zlib.decompress(stream) for stream in streams)
+    assert b"(Pagina 1 van %d)" % pageCount in content
+    assert b"(01/01/2024 - 07/01/2024)" in content
+    assert LONG_DESCRIPTION.strip().encode() not in content
+    assert b"\x85) Tj" in content  # truncated with an ellipsis
+
+
+def test_fit_text_truncates_to_width():
+    assert fitText("Les", 180) == "Les"
+    fitted = fitText(LONG_DESCRIPTION, 180)
+    assert fitted.endswith("…")
+    assert textWidth(fitted, FONT_SIZE) <= 180
+    assert LONG_DESCRIPTION.startswith(fitted[:-1])
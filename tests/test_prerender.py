@@ -0,0 +1,13 @@
+from munch import Munch
+
+from app.auto_invoice.prerender import invoiceFingerprint
+
+
+def test_fingerprint_differs_per_entity():
+    invoiceParams = Munch(clientName="A", invoiceNumber="1.1.01.99")
+    assert invoiceFingerprint(invoiceParams, 1, "1-a") != invoiceFingerprint(
+        invoiceParams, 2, "1-a"
+    )
+    assert invoiceFingerprint(invoiceParams, 1, "1-a") == invoiceFingerprint(
+        Munch(invoiceParams), 1, "1-a"
+    )